@@ -0,0 +1,60 @@
+"""
+Cursors of /api/recipes/changes/.
+
+Updated recipes and deletion markers are read as two streams, ordered
+by (updated_at, id) and (deleted_at, id) along their indexes. A cursor
+keeps the last position in both, encoded as an opaque string. Rows newer
+than CHANGES_SETTLE_SECONDS are held back, so a transaction that
+commits a bit later with an earlier timestamp isn't skipped.
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+
+def encode_cursor(positions):
+    """positions is [(timestamp, id) or None] for both streams."""
+    return base64.urlsafe_b64encode(json.dumps([
+        None if position is None else (position[0].isoformat(), position[1])
+        for position in positions
+    ]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Returns positions of encode_cursor(), raises ValueError."""
+    if not cursor:
+        return [None, None]
+    try:
+        first, second = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        positions = [
+            None if position is None else (
+                datetime.fromisoformat(position[0]), int(position[1])
+            )
+            for position in (first, second)
+        ]
+    except (binascii.Error, UnicodeError, ValueError, TypeError, IndexError):
+        raise ValueError('Invalid cursor')
+    if any(position is not None and position[0].tzinfo is None
+           for position in positions):
+        raise ValueError('Invalid cursor')
+    return positions
+
+
+def read_stream(queryset, time_field, position, limit):
+    """Returns up to limit rows after position and whether more follow."""
+    horizon = timezone.now() - timedelta(
+        seconds=settings.CHANGES_SETTLE_SECONDS
+    )
+    queryset = queryset.filter(**{f'{time_field}__lte': horizon})
+    if position is not None:
+        changed_at, pk = position
+        queryset = queryset.filter(
+            **{f'{time_field}__gte': changed_at}
+        ).exclude(**{time_field: changed_at, 'id__lte': pk})
+    rows = list(queryset.order_by(time_field, 'id')[:limit + 1])
+    return rows[:limit], len(rows) > limit
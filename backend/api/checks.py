@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.checks import Warning
+
+from backend.db_routers import get_replicas
+
+
+LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache',
+                'django.core.cache.backends.dummy.DummyCache')
+
+
+def check_replica_pin_cache(app_configs, **kwargs):
+    """Read-your-writes pins only work in a cache shared by workers."""
+    if get_replicas() and settings.CACHES['default']['BACKEND'] in (
+        LOCAL_CACHES
+    ):
+        return [Warning(
+            'DB_REPLICAS is set but the default cache is local to the '
+            'process, so a client pinned to the primary after a write can '
+            'read stale data from a replica in another worker.',
+            hint='Set CACHE_BACKEND and CACHE_LOCATION to a shared cache '
+                 'such as memcached.',
+            id='api.W001',
+        )]
+    return []
@@ -0,0 +1,114 @@
+"""
+Facet counts for the recipe list, see RecipeViewSet.list.
+
+All requested facets are counted by one query with GROUPING SETS over
+the filtered recipes. Results are cached for FACETS_CACHE_SECONDS per
+filter signature.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+
+from recipes.models import Recipe, Tag
+
+
+FACETS = ('tags', 'cooking_time')
+
+# Query parameters that don't change the filtered set.
+IGNORED_PARAMS = ('page', 'limit', 'facets', 'fields', 'omit')
+
+# Filters whose result depends on the user.
+USER_PARAMS = ('is_favorited', 'is_in_shopping_cart')
+
+
+def get_cache_key(request, facets):
+    params = sorted(
+        (name, value)
+        for name, values in request.query_params.lists()
+        if name not in IGNORED_PARAMS
+        for value in values
+    )
+    if request.user.is_authenticated and any(
+        name in USER_PARAMS for name, _ in params
+    ):
+        params.append(('user', str(request.user.id)))
+    signature = hashlib.sha256(repr((facets, params)).encode()).hexdigest()
+    return f'facets:{signature}'
+
+
+def count_facets(queryset, facets):
+    """Returns {facet: counts} for the recipes of the queryset."""
+    try:
+        recipes_sql, params = (
+            queryset.order_by().values('id').query.sql_with_params()
+        )
+    except EmptyResultSet:
+        recipes_sql, params = None, ()
+    buckets = settings.FACETS_COOKING_TIME_BUCKETS
+    bucket = (
+        'width_bucket(recipe.cooking_time, ARRAY[%s])'
+        % ', '.join(str(int(minutes)) for minutes in buckets)
+    )
+    join = ''
+    grouping_sets = []
+    tag = bucket_number = 'NULL'
+    is_tag_row = '1'
+    if 'tags' in facets:
+        join = (
+            f'LEFT JOIN {Recipe.tags.through._meta.db_table} recipe_tag '
+            'ON recipe_tag.recipe_id = recipe.id'
+        )
+        tag = 'recipe_tag.tag_id'
+        grouping_sets.append(f'({tag})')
+    if 'cooking_time' in facets:
+        bucket_number = bucket
+        is_tag_row = f'GROUPING({bucket})'
+        grouping_sets.append(f'({bucket})')
+    sql = (
+        f'SELECT {tag}, {bucket_number}, {is_tag_row}, '
+        'COUNT(DISTINCT recipe.id) '
+        f'FROM {Recipe._meta.db_table} recipe {join} '
+        f'WHERE recipe.id IN ({recipes_sql}) '
+        f'GROUP BY GROUPING SETS ({", ".join(grouping_sets)})'
+    )
+    rows = []
+    if recipes_sql is not None:
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+    tag_counts = {}
+    bucket_counts = {}
+    for tag_id, number, tag_row, count in rows:
+        if not tag_row:
+            bucket_counts[number] = count
+        elif tag_id is not None:
+            tag_counts[tag_id] = count
+    result = {}
+    if 'tags' in facets:
+        result['tags'] = [
+            {'id': tag.id, 'name': tag.name, 'slug': tag.slug,
+             'count': tag_counts.get(tag.id, 0)}
+            for tag in Tag.objects.order_by('id')
+        ]
+    if 'cooking_time' in facets:
+        bounds = (None, *buckets, None)
+        result['cooking_time'] = [
+            {'from': bounds[number], 'to': bounds[number + 1],
+             'count': bucket_counts.get(number, 0)}
+            for number in range(len(bounds) - 1)
+        ]
+    return result
+
+
+def get_facets(request, queryset, facets):
+    """Cached count_facets() for the filters of the request."""
+    key = get_cache_key(request, facets)
+    result = cache.get(key)
+    if result is None:
+        result = count_facets(queryset, facets)
+        cache.set(key, result, settings.FACETS_CACHE_SECONDS)
+    return result
@@ -1,5 +1,7 @@
+from django.db.models import Case, IntegerField, Q, When
 from django_filters import rest_framework as rest_filters
 from django_filters import ModelMultipleChoiceFilter
+from rest_framework import filters
 
 from recipes.models import Recipe, Tag, RecipeFavorite, RecipeInShoppingCart
 
@@ -45,3 +47,33 @@ class RecipeFilter(rest_filters.FilterSet):
                     ).values_list('recipe', flat=True)
                 )
         return queryset.none()
+
+
+class UserSearchFilter(filters.SearchFilter):
+    """?search= over usernames and names.
+
+    Every term has to occur in one of the fields. Users whose username
+    is the first term come first, then those with a field starting with
+    it. The lookups are served by the trigram indexes of
+    recipes/migrations/0012_user_search.py.
+    """
+    search_param = 'search'
+    search_fields = ('username', 'first_name', 'last_name')
+
+    def get_search_fields(self, view, request):
+        return self.search_fields
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        queryset = super().filter_queryset(request, queryset, view)
+        prefix = Q()
+        for field in self.search_fields:
+            prefix |= Q(**{f'{field}__istartswith': terms[0]})
+        return queryset.annotate(search_rank=Case(
+            When(username__iexact=terms[0], then=0),
+            When(prefix, then=1),
+            default=2,
+            output_field=IntegerField(),
+        )).order_by('search_rank', 'username')
@@ -0,0 +1,274 @@
+"""
+In-process request metrics exported in Prometheus text format.
+
+Every process keeps its own registry. With several gunicorn workers
+set METRICS_DIR: each process then writes its series to a file there
+at most every METRICS_FLUSH_SECONDS, and /metrics sums the files of
+all processes. Files of exited workers are kept so totals never go
+back, gunicorn.conf.py clears the directory when the server starts.
+Without it /metrics shows the process that served the scrape only.
+"""
+
+import copy
+import json
+import os
+import time
+import threading
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import HttpResponse
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+current_timings = ContextVar('current_timings', default=None)
+
+
+class RequestTimings:
+    """Time spent in each stage of a single request."""
+
+    def __init__(self):
+        self.queries = 0
+        self.durations = {'db': 0.0, 'serialize': 0.0, 'render': 0.0}
+        self.depth = {}
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.durations['db'] += time.perf_counter() - start
+
+
+@contextmanager
+def stage(name):
+    """Adds the time spent in the block to a stage of the current request.
+
+    Nested blocks of the same stage are counted once.
+    """
+    timings = current_timings.get()
+    if timings is None or timings.depth.get(name):
+        yield
+        return
+    timings.depth[name] = 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.durations[name] += time.perf_counter() - start
+        timings.depth[name] = 0
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.lock = threading.Lock()
+        self.series = {}
+        REGISTRY.append(self)
+
+    def format_labels(self, values, extra=''):
+        pairs = [f'{label}="{value}"'
+                 for label, value in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def snapshot(self):
+        with self.lock:
+            return copy.deepcopy(self.series)
+
+    def render(self, series):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} {self.kind}'
+        for values, data in sorted(series.items()):
+            yield from self.render_series(values, data)
+
+    def merge(self, data, other):
+        raise NotImplementedError
+
+    def render_series(self, values, data):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, values, amount=1):
+        with self.lock:
+            self.series[values] = self.series.get(values, 0) + amount
+
+    def merge(self, data, other):
+        return data + other
+
+    def render_series(self, values, data):
+        yield f'{self.name}{self.format_labels(values)} {data}'
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels, buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+
+    def observe(self, values, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            data = self.series.get(values)
+            if data is None:
+                data = self.series[values] = [
+                    [0] * (len(self.buckets) + 1), 0.0, 0
+                ]
+            data[0][index] += 1
+            data[1] += value
+            data[2] += 1
+
+    def merge(self, data, other):
+        return [[a + b for a, b in zip(data[0], other[0])],
+                data[1] + other[1], data[2] + other[2]]
+
+    def render_series(self, values, data):
+        counts, total, count = data
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += bucket_count
+            labels = self.format_labels(values, f'le="{bound}"')
+            yield f'{self.name}_bucket{labels} {cumulative}'
+        yield f'{self.name}_sum{self.format_labels(values)} {total}'
+        yield f'{self.name}_count{self.format_labels(values)} {count}'
+
+
+REGISTRY = []
+
+REQUEST_LABELS = ('route', 'method')
+request_duration = Histogram(
+    'foodgram_request_duration_seconds',
+    'Time spent handling a request.', REQUEST_LABELS
+)
+db_duration = Histogram(
+    'foodgram_request_db_duration_seconds',
+    'Time spent in SQL queries per request.', REQUEST_LABELS
+)
+serialize_duration = Histogram(
+    'foodgram_request_serialize_duration_seconds',
+    'Time spent in serializers per request.', REQUEST_LABELS
+)
+render_duration = Histogram(
+    'foodgram_request_render_duration_seconds',
+    'Time spent rendering the response.', REQUEST_LABELS
+)
+response_size = Histogram(
+    'foodgram_response_size_bytes',
+    'Size of the response body.', REQUEST_LABELS, buckets=SIZE_BUCKETS
+)
+db_queries = Counter(
+    'foodgram_db_queries_total',
+    'Number of SQL queries.', REQUEST_LABELS
+)
+microcache_requests = Counter(
+    'foodgram_microcache_requests_total',
+    'Anonymous requests by micro-cache result.', ('result',)
+)
+query_timeouts = Counter(
+    'foodgram_query_timeouts_total',
+    'Cancelled statements and requests past their deadline.',
+    ('route', 'kind')
+)
+
+
+def observe_request(route, method, duration, timings, size):
+    labels = (route, method)
+    request_duration.observe(labels, duration)
+    db_duration.observe(labels, timings.durations['db'])
+    serialize_duration.observe(labels, timings.durations['serialize'])
+    render_duration.observe(labels, timings.durations['render'])
+    db_queries.inc(labels, timings.queries)
+    if size is not None:
+        response_size.observe(labels, size)
+    if settings.METRICS_DIR:
+        flush()
+
+
+flushed = {'key': None, 'path': None, 'time': 0.0}
+flush_lock = threading.Lock()
+
+
+def flush(force=False):
+    """Writes the series of this process to its file in METRICS_DIR."""
+    now = time.monotonic()
+    with flush_lock:
+        key = (os.getpid(), settings.METRICS_DIR)
+        if flushed['key'] != key:
+            # A file per process start, pids of exited workers are reused.
+            flushed['key'] = key
+            flushed['path'] = os.path.join(
+                settings.METRICS_DIR, f'{os.getpid()}-{uuid.uuid4().hex}.json'
+            )
+        elif not force and now - flushed['time'] < (
+            settings.METRICS_FLUSH_SECONDS
+        ):
+            return
+        flushed['time'] = now
+        content = json.dumps({
+            metric.name: [[list(values), data]
+                          for values, data in metric.snapshot().items()]
+            for metric in REGISTRY
+        })
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        temporary = flushed['path'] + '.tmp'
+        with open(temporary, 'w') as file:
+            file.write(content)
+        os.replace(temporary, flushed['path'])
+
+
+def collect():
+    """Series of all processes writing to METRICS_DIR, summed."""
+    flush(force=True)
+    merged = {metric.name: {} for metric in REGISTRY}
+    metrics = {metric.name: metric for metric in REGISTRY}
+    for name in os.listdir(settings.METRICS_DIR):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(settings.METRICS_DIR, name)) as file:
+                process = json.load(file)
+        except FileNotFoundError:
+            continue
+        for metric_name, series in process.items():
+            metric = metrics.get(metric_name)
+            if metric is None:
+                continue
+            for values, data in series:
+                values = tuple(values)
+                current = merged[metric_name].get(values)
+                merged[metric_name][values] = (
+                    data if current is None else metric.merge(current, data)
+                )
+    return merged
+
+
+def render_metrics():
+    if settings.METRICS_DIR:
+        series = collect()
+    else:
+        series = {metric.name: metric.snapshot() for metric in REGISTRY}
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render(series[metric.name]))
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    return HttpResponse(render_metrics(),
+                        content_type='text/plain; version=0.0.4')
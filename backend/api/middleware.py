@@ -0,0 +1,618 @@
+import hashlib
+import logging
+import math
+import random
+import re
+import time
+import zlib
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import (DatabaseError, InterfaceError, OperationalError,
+                       connections)
+from django.http import HttpResponse, JsonResponse
+from django.urls import Resolver404, resolve
+from django.utils.cache import patch_vary_headers
+
+from psycopg2.errors import QueryCanceled
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from backend.db_routers import get_replicas, mark_unhealthy, replica_state
+from . import metrics, profiling
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_credentials(request):
+    """Token or session cookie of the request, if any."""
+    return (
+        request.META.get('HTTP_AUTHORIZATION')
+        or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+
+
+class ServerTimingMiddleware:
+    """Reports per request SQL, serializer and render timings.
+
+    Timings go to the Server-Timing header and to the histograms
+    exported at /metrics.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = metrics.RequestTimings()
+        token = metrics.current_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(timings.execute_wrapper)
+                    )
+                response = self.get_response(request)
+        finally:
+            metrics.current_timings.reset(token)
+        duration = time.perf_counter() - start
+        size = None if response.streaming else len(response.content)
+        response['Server-Timing'] = self.format_header(timings, duration,
+                                                       size)
+        match = request.resolver_match
+        metrics.observe_request(
+            match.view_name if match else 'unmatched',
+            request.method,
+            duration,
+            timings,
+            size,
+        )
+        return response
+
+    def process_template_response(self, request, response):
+        timings = metrics.current_timings.get()
+        start = time.perf_counter()
+
+        def stop(response):
+            timings.durations['render'] += time.perf_counter() - start
+
+        response.add_post_render_callback(stop)
+        return response
+
+    def format_header(self, timings, duration, size):
+        durations = timings.durations
+        entries = [
+            f'db;dur={durations["db"] * 1000:.1f};'
+            f'desc="{timings.queries} queries"',
+            f'serialize;dur={durations["serialize"] * 1000:.1f}',
+            f'render;dur={durations["render"] * 1000:.1f}',
+            f'total;dur={duration * 1000:.1f}',
+        ]
+        if size is not None:
+            entries.append(f'size;desc="{size} bytes"')
+        return ', '.join(entries)
+
+
+class ReplicaRoutingMiddleware:
+    """Lets safe requests read from replicas.
+
+    After a successful write the client is pinned to the primary for
+    REPLICA_PIN_SECONDS, so it reads its own writes. Clients are told
+    apart by their token or session cookie, without a database query.
+    Pins are kept in the default cache, which has to be shared by all
+    workers (see api/checks.py).
+
+    A request that fails with a server error after a replica query
+    raised a database error is run again on the primary, and the
+    replica is marked unhealthy.
+    """
+
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        safe = request.method in self.safe_methods
+        pin_key = self.get_pin_key(request)
+        state = None
+        if safe and get_replicas() and not (pin_key and cache.get(pin_key)):
+            state = {}
+        token = replica_state.set(state)
+        try:
+            if state is None:
+                response = self.get_response(request)
+            else:
+                response = self.read_from_replica(request, state)
+        finally:
+            replica_state.reset(token)
+        if not safe and pin_key and response.status_code < 400:
+            cache.set(pin_key, True, settings.REPLICA_PIN_SECONDS)
+        return response
+
+    def read_from_replica(self, request, state):
+        with ExitStack() as stack:
+            for alias in get_replicas():
+                stack.enter_context(connections[alias].execute_wrapper(
+                    partial(self.watch_replica, state)
+                ))
+            response = self.get_response(request)
+        failed = state.get('failed')
+        if failed is None or response.status_code < 500:
+            return response
+        logger.warning('Replica %s failed on %s, retrying on primary',
+                       failed, request.path)
+        mark_unhealthy(failed)
+        replica_state.set(None)
+        return self.get_response(request)
+
+    def watch_replica(self, state, execute, sql, params, many, context):
+        try:
+            return execute(sql, params, many, context)
+        except (OperationalError, InterfaceError) as error:
+            # Cancelled by statement_timeout, the primary would be no faster.
+            if not isinstance(error.__cause__, QueryCanceled):
+                state['failed'] = context['connection'].alias
+            raise
+
+    def get_pin_key(self, request):
+        credentials = get_credentials(request)
+        if not credentials:
+            return None
+        return 'replica-pin:' + hashlib.sha256(
+            credentials.encode()
+        ).hexdigest()
+
+
+# Memcached refuses larger items.
+COMPRESSION_CACHE_MAX_BYTES = 1024 * 1024
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript',
+                      'application/x-ndjson', 'application/xml',
+                      'image/svg+xml')
+
+
+def choose_encoding(accept_encoding):
+    """Returns 'br', 'gzip' or None for an Accept-Encoding header."""
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        match = re.search(r'q=([^;]*)', params)
+        try:
+            weights[name.strip().lower()] = float(match[1]) if match else 1
+        except ValueError:
+            continue
+    default = weights.get('*', 0)
+    available = ('br', 'gzip') if brotli is not None else ('gzip',)
+    best_weight, best = 0, None
+    for encoding in available:
+        weight = weights.get(encoding, default)
+        if weight > best_weight:
+            best_weight, best = weight, encoding
+    return best
+
+
+def get_compressor(encoding):
+    """Returns compress(data) and finish() functions of a stream."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(
+            quality=settings.COMPRESSION_BROTLI_QUALITY
+        )
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL,
+                                  zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress, compressor.flush
+
+
+def compress(content, encoding):
+    process, finish = get_compressor(encoding)
+    return process(content) + finish()
+
+
+def compress_stream(chunks, encoding):
+    """Compresses chunks as they come, output is sent when available."""
+    process, finish = get_compressor(encoding)
+    for chunk in chunks:
+        data = process(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+class CompressionMiddleware:
+    """Compresses responses with brotli or gzip from Accept-Encoding.
+
+    Bodies under COMPRESSION_MIN_BYTES and types that are compressed
+    already, like images, are sent as is. Streaming responses are
+    compressed chunk by chunk. Compressed bodies of anonymous GET
+    responses are cached by content hash, so repeated pages are
+    compressed once.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not response.streaming and (
+            len(response.content) < settings.COMPRESSION_MIN_BYTES
+        ):
+            return response
+        if response.has_header('Content-Encoding') or not response.get(
+            'Content-Type', ''
+        ).startswith(COMPRESSIBLE_TYPES):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')
+        )
+        if encoding is None:
+            return response
+        if response.streaming:
+            response.streaming_content = compress_stream(
+                response.streaming_content, encoding
+            )
+            del response['Content-Length']
+        else:
+            content = self.compress(request, response, encoding)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+        if response.has_header('ETag'):
+            response['ETag'] = re.sub(r'^"', 'W/"', response['ETag'])
+        response['Content-Encoding'] = encoding
+        return response
+
+    def compress(self, request, response, encoding):
+        cacheable = (
+            request.method == 'GET'
+            and response.status_code == 200
+            and 'HTTP_AUTHORIZATION' not in request.META
+            and not response.cookies
+            and len(response.content) <= COMPRESSION_CACHE_MAX_BYTES
+        )
+        if not cacheable:
+            return compress(response.content, encoding)
+        key = 'compressed:{}:{}'.format(
+            encoding, hashlib.sha256(response.content).hexdigest()
+        )
+        content = cache.get(key)
+        if content is None:
+            content = compress(response.content, encoding)
+            cache.set(key, content, settings.COMPRESSION_CACHE_SECONDS)
+        return content
+
+
+class MicroCacheMiddleware:
+    """Caches responses to anonymous GET requests for a few seconds.
+
+    Fresh entries are served for MICROCACHE_SECONDS. After that a single
+    request renders the page again while concurrent ones get the stale
+    copy, or wait for the new one if there is none. When rendering
+    fails with a server error, copies up to MICROCACHE_STALE_SECONDS
+    old are served instead. Results are counted in
+    foodgram_microcache_requests_total.
+
+    Entries are kept per scheme and host, the bodies hold absolute
+    pagination links. Requests with bypass_key in their environ, like
+    the worker warm-up, skip the cache.
+    """
+
+    paths = re.compile(r'^/api/(recipes|tags|ingredients)/(\d+/)?$')
+    bypass_key = 'api.microcache.bypass'
+    lock_seconds = 10
+    wait_interval = 0.05
+    skipped_headers = ('content-length', 'server-timing')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self.is_cacheable(request):
+            return self.get_response(request)
+        key = self.get_key(request)
+        entry = cache.get(key)
+        fresh = settings.MICROCACHE_SECONDS
+        if entry is not None and self.get_age(entry) < fresh:
+            return self.respond(request, entry, 'hit')
+        lock_key = key + ':lock'
+        if not cache.add(lock_key, True, self.lock_seconds):
+            if entry is not None:
+                return self.respond(request, entry, 'stale')
+            entry = self.wait(key)
+            if entry is not None:
+                return self.respond(request, entry, 'collapsed')
+            return self.render(request, key, None)
+        try:
+            return self.render(request, key, entry)
+        finally:
+            cache.delete(lock_key)
+
+    def is_cacheable(self, request):
+        return (
+            settings.MICROCACHE_SECONDS > 0
+            and request.method == 'GET'
+            and self.paths.match(request.path_info)
+            and not get_credentials(request)
+            and not request.META.get(self.bypass_key)
+        )
+
+    def get_key(self, request):
+        query = sorted(request.GET.lists())
+        signature = repr((request.scheme, request.get_host(),
+                          request.path_info, query,
+                          request.META.get('HTTP_ACCEPT', '')))
+        return 'microcache:' + hashlib.sha256(signature.encode()).hexdigest()
+
+    def get_age(self, entry):
+        return time.time() - entry['created']
+
+    def wait(self, key):
+        """Returns the entry stored by the request holding the lock."""
+        deadline = time.monotonic() + settings.MICROCACHE_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(self.wait_interval)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry
+        return None
+
+    def render(self, request, key, stale):
+        response = self.get_response(request)
+        if (
+            response.status_code >= 500 and stale is not None
+            and self.get_age(stale) < settings.MICROCACHE_STALE_SECONDS
+        ):
+            return self.respond(request, stale, 'stale')
+        if response.status_code == 200 and not (
+            response.streaming or response.cookies
+        ):
+            cache.set(key, {
+                'created': time.time(),
+                'content': response.content,
+                'headers': [
+                    (name, value) for name, value in response.items()
+                    if name.lower() not in self.skipped_headers
+                ],
+            }, settings.MICROCACHE_SECONDS + settings.MICROCACHE_STALE_SECONDS)
+        metrics.microcache_requests.inc(('miss',))
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def respond(self, request, entry, result):
+        try:
+            request.resolver_match = resolve(request.path_info)
+        except Resolver404:
+            pass
+        metrics.microcache_requests.inc((result,))
+        response = HttpResponse(entry['content'])
+        for name, value in entry['headers']:
+            response[name] = value
+        response['Age'] = str(int(self.get_age(entry)))
+        response['X-Cache'] = result.upper()
+        return response
+
+
+class RequestDeadlineExceeded(Exception):
+    """Raised instead of running a query past the request deadline."""
+
+
+# QueryLimits of the current request.
+query_limits = ContextVar('query_limits', default=None)
+
+
+class QueryLimits:
+    """Statement timeout and deadline applied to the queries of a request.
+
+    The timeout is set on a connection with SET statement_timeout before
+    its first query, and again when it changes, when the time left
+    before the deadline gets shorter or after leaving a transaction that
+    might have rolled the setting back. The setting lasts for the
+    session, so apply() resets it on the connections it was set on
+    before they serve anything else. A deadline of None never passes.
+    """
+
+    def __init__(self, timeout, deadline):
+        self.timeout = timeout
+        self.deadline = deadline
+        self.route = 'unmatched'
+        self.applied = {}
+
+    @contextmanager
+    def apply(self):
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(self.execute_wrapper)
+                    )
+                yield
+        finally:
+            self.reset()
+
+    def reset(self):
+        for alias in self.applied:
+            connection = connections[alias]
+            if connection.connection is None:
+                continue
+            try:
+                self.run(connection, 'RESET statement_timeout')
+            except DatabaseError:
+                logger.exception('Resetting statement_timeout failed')
+                # A new connection starts with the default.
+                connection.close()
+        self.applied.clear()
+
+    def run(self, connection, sql):
+        """Runs sql on a cursor of its own, bypassing execute wrappers."""
+        with connection.wrap_database_errors:
+            with connection.connection.cursor() as cursor:
+                cursor.execute(sql)
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        connection = context['connection']
+        timeout = self.timeout
+        if self.deadline is not None:
+            left = self.deadline - time.monotonic()
+            if left <= 0:
+                self.log('deadline', sql)
+                raise RequestDeadlineExceeded(self.route)
+            timeout = min(timeout, left)
+        # Rounded up, a statement cancelled early looks like a timeout.
+        milliseconds = max(1, math.ceil(timeout * 1000))
+        applied = self.applied.get(connection.alias)
+        if (
+            applied is None
+            or applied[0] != self.timeout
+            or applied[1] > milliseconds
+            or applied[2] != connection.in_atomic_block
+        ):
+            statement = f'SET statement_timeout = {milliseconds}'
+            if context['cursor'].cursor.name:
+                # Server side cursors of iterator() only take queries.
+                self.run(connection, statement)
+            else:
+                execute(statement, None, False, context)
+            self.applied[connection.alias] = (
+                self.timeout, milliseconds, connection.in_atomic_block
+            )
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError as error:
+            if not isinstance(error.__cause__, QueryCanceled):
+                raise
+            if (
+                self.deadline is not None
+                and time.monotonic() >= self.deadline
+            ):
+                self.log('deadline', sql)
+                raise RequestDeadlineExceeded(self.route) from error
+            self.log('statement', sql)
+            raise
+
+    def log(self, kind, sql):
+        metrics.query_timeouts.inc((self.route, kind))
+        logger.warning('Query %s on %s, statement timeout %.0f ms: %s',
+                       'cancelled' if kind == 'statement' else 'past deadline',
+                       self.route, self.timeout * 1000, sql)
+
+
+class QueryTimeoutMiddleware:
+    """Cancels queries that run too long.
+
+    Statements are limited to the statement_timeout of the view or
+    statement_timeouts[action], picked like throttle scopes, by default
+    STATEMENT_TIMEOUT_SECONDS. A request gets REQUEST_DEADLINE_SECONDS
+    in total, its statements never run past it, unless the action is
+    in deadline_exempt_actions of the view. A cancelled statement is
+    answered with 503, a passed deadline with 504.
+
+    Bodies of streaming responses are read after the request, under
+    the same limits. Long exports should be exempt from the deadline,
+    a query cancelled in the body cuts the response short.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        limits = QueryLimits(
+            settings.STATEMENT_TIMEOUT_SECONDS,
+            time.monotonic() + settings.REQUEST_DEADLINE_SECONDS,
+        )
+        token = query_limits.set(limits)
+        try:
+            with limits.apply():
+                response = self.get_response(request)
+        finally:
+            query_limits.reset(token)
+        if response.streaming:
+            response.streaming_content = self.stream(
+                limits, response.streaming_content
+            )
+        return response
+
+    def stream(self, limits, content):
+        with limits.apply():
+            yield from content
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        limits = query_limits.get()
+        view = getattr(view_func, 'cls', None)
+        action = getattr(view_func, 'actions', {}).get(
+            request.method.lower()
+        )
+        timeouts = getattr(view, 'statement_timeouts', {})
+        limits.timeout = timeouts.get(
+            action, getattr(view, 'statement_timeout', limits.timeout)
+        )
+        if action in getattr(view, 'deadline_exempt_actions', ()):
+            limits.deadline = None
+        limits.route = request.resolver_match.view_name
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, RequestDeadlineExceeded):
+            return JsonResponse(
+                {'detail': 'Request took too long.'}, status=504
+            )
+        if (
+            isinstance(exception, OperationalError)
+            and isinstance(exception.__cause__, QueryCanceled)
+        ):
+            response = JsonResponse(
+                {'detail': 'Query took too long, try again later.'},
+                status=503,
+            )
+            response['Retry-After'] = '5'
+            return response
+        return None
+
+
+class ProfilingMiddleware:
+    """Profiles a PROFILE_SAMPLE_RATE share of requests.
+
+    Requests with an X-Profile header signed by profiling.make_token()
+    are always profiled. Profiles are saved to PROFILE_DIR, see
+    api/profiling.py.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+        profile = profiling.Profile(ProfilingMiddleware.__call__.__code__)
+        start = time.perf_counter()
+        profile.sampler.start()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(profile.execute_wrapper)
+                    )
+                response = self.get_response(request)
+        finally:
+            profile.sampler.stop()
+        match = request.resolver_match
+        try:
+            profile.save(match.view_name if match else 'unmatched',
+                         request.method, request.get_full_path(),
+                         response.status_code, time.perf_counter() - start)
+        except OSError:
+            logger.exception('Could not save the profile')
+        return response
+
+    def should_profile(self, request):
+        token = request.META.get('HTTP_X_PROFILE')
+        if token:
+            return profiling.check_token(token)
+        return random.random() < settings.PROFILE_SAMPLE_RATE
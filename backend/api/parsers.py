@@ -0,0 +1,29 @@
+import json
+
+from django.utils.datastructures import MultiValueDict
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+
+class MultiPartJSONParser(MultiPartParser):
+    """Multipart form with the fields as JSON in a 'data' part.
+
+    Files come in their own parts, e.g. 'image', and are streamed to
+    temporary files by Django's upload handlers instead of being sent
+    as base64 inside JSON. Forms without a 'data' part are parsed as
+    usual.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        result = super().parse(stream, media_type, parser_context)
+        if 'data' not in result.data:
+            return result
+        try:
+            data = json.loads(result.data['data'])
+        except ValueError as error:
+            raise ParseError(f'JSON parse error in data part - {error}')
+        if not isinstance(data, dict):
+            raise ParseError('Data part must be a JSON object')
+        # Request would merge a MultiValueDict into a dict as lists.
+        data.update(result.files.dict())
+        return DataAndFiles(data, MultiValueDict())
@@ -0,0 +1,111 @@
+"""
+Sampling profiler of single requests, see ProfilingMiddleware.
+
+While a request runs, a thread records the call stack of the request
+thread every PROFILE_INTERVAL_MS and the SQL of its queries. Profiles
+are saved as JSON to PROFILE_DIR, stacks in the folded format of flame
+graph tools ("outer;inner;leaf": samples). The aggregate_profiles
+command merges them per route.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core import signing
+
+
+SIGNING_SALT = 'api.profiling'
+
+
+def make_token():
+    """Value of the X-Profile header that makes a request profiled."""
+    return signing.TimestampSigner(salt=SIGNING_SALT).sign('profile')
+
+
+def check_token(token):
+    try:
+        signing.TimestampSigner(salt=SIGNING_SALT).unsign(
+            token, max_age=settings.PROFILE_TOKEN_SECONDS
+        )
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def get_frame_name(frame):
+    # co_qualname includes the class, Python 3.11+.
+    code = frame.f_code
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f'{frame.f_globals.get("__name__", "?")}.{name}'
+
+
+class Sampler(threading.Thread):
+    """Counts the stacks of a thread below the frame running root_code."""
+
+    def __init__(self, thread_id, root_code, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.root_code = root_code
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if self.stopped.is_set():
+                break
+            names = []
+            while frame is not None and frame.f_code is not self.root_code:
+                names.append(get_frame_name(frame))
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class Profile:
+    """Stacks and queries of one request."""
+
+    def __init__(self, root_code):
+        self.sampler = Sampler(threading.get_ident(), root_code,
+                               settings.PROFILE_INTERVAL_MS / 1000)
+        self.queries = []
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'ms': round((time.perf_counter() - start) * 1000, 2),
+                'alias': context['connection'].alias,
+            })
+
+    def save(self, route, method, path, status, duration):
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        started = time.time() - duration
+        name = (f'{route}-{time.strftime("%Y%m%d%H%M%S", time.gmtime())}-'
+                f'{uuid.uuid4().hex[:8]}.json')
+        with open(os.path.join(settings.PROFILE_DIR, name), 'w') as file:
+            json.dump({
+                'route': route,
+                'method': method,
+                'path': path,
+                'status': status,
+                'started': started,
+                'duration_ms': round(duration * 1000, 2),
+                'interval_ms': settings.PROFILE_INTERVAL_MS,
+                'stacks': self.sampler.stacks,
+                'queries': self.queries,
+            }, file)
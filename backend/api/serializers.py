@@ -1,34 +1,154 @@
 import base64
+import binascii
 
-from django.db import transaction
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.uploadedfile import TemporaryUploadedFile
 from django.contrib.auth import get_user_model
+from PIL import Image
 from rest_framework import serializers, validators
+from rest_framework.relations import MANY_RELATION_KWARGS
 
 from recipes.models import (
     UserFollowing, Ingredient, Tag, Recipe, RecipeIngredient,
-    RecipeFavorite, RecipeInShoppingCart
+    RecipeFavorite, RecipeInShoppingCart, RecipeLinkRemoval, content_hash
 )
+from jobs.models import Job
+from .changes import decode_cursor
+from .metrics import stage
 from .validators import validate_non_empty
 
 
 MAX_SMALL_INT_VALUE = 32767
+MAX_BULK_IDS = 100
+DEFAULT_CHANGES = 100
+MAX_CHANGES = 500
+BASE64_CHUNK_SIZE = 4 * 64 * 1024
 
 
 User = get_user_model()
 
 
+class TimedSerializerMixin:
+    """Counts representation time towards the request metrics."""
+
+    def to_representation(self, instance):
+        with stage('serialize'):
+            return super().to_representation(instance)
+
+
+class SelectFieldsSerializerMixin:
+    """Outputs only the serializer fields named in fields=, if given."""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
 class Base64ImageField(serializers.ImageField):
+    """Image given as a base64 data URL or as a multipart file.
+
+    Base64 is decoded in chunks into a temporary file. The size and
+    the dimensions from the image header are checked before Pillow
+    decodes the image.
+    """
+
+    default_error_messages = {
+        'too_large': 'Image is larger than {max_bytes} bytes.',
+        'too_wide': 'Image is larger than {max_side}x{max_side} pixels.',
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
-
+            data = self.decode(data)
+        self.check_limits(data)
         return super().to_internal_value(data)
 
+    def decode(self, data):
+        start = data.find(';base64,')
+        if start == -1:
+            self.fail('invalid_image')
+        content_type = data[len('data:'):start]
+        start += len(';base64,')
+        if (len(data) - start) // 4 * 3 > settings.IMAGE_MAX_BYTES:
+            self.fail('too_large', max_bytes=settings.IMAGE_MAX_BYTES)
+        file = TemporaryUploadedFile(
+            'temp.' + content_type.split('/')[-1], content_type, 0, None
+        )
+        try:
+            for offset in range(start, len(data), BASE64_CHUNK_SIZE):
+                file.write(base64.b64decode(
+                    data[offset:offset + BASE64_CHUNK_SIZE]
+                ))
+        except binascii.Error:
+            file.close()
+            self.fail('invalid_image')
+        file.size = file.tell()
+        file.seek(0)
+        return file
+
+    def check_limits(self, file):
+        if not hasattr(file, 'read'):
+            return
+        if file.size > settings.IMAGE_MAX_BYTES:
+            self.fail('too_large', max_bytes=settings.IMAGE_MAX_BYTES)
+        try:
+            with Image.open(file) as image:
+                width, height = image.size
+        except Exception:
+            # Left for ImageField to report.
+            return
+        finally:
+            file.seek(0)
+        if max(width, height) > settings.IMAGE_MAX_SIDE:
+            self.fail('too_wide', max_side=settings.IMAGE_MAX_SIDE)
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    def to_internal_value(self, data):
+        pks = super().to_internal_value(data)
+        return self.child_relation.resolve(pks)
+
 
-class UserSerializer(serializers.ModelSerializer):
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Primary key field that loads objects with one query per list.
+
+    On its own the field only checks the pk type and returns the pk,
+    the caller passes collected pks to resolve(). With many=True the
+    list is resolved right away.
+    """
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def to_internal_value(self, data):
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        try:
+            if isinstance(data, bool):
+                raise TypeError
+            return self.get_queryset().model._meta.pk.to_python(data)
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+    def resolve(self, pks):
+        objects = self.get_queryset().in_bulk(pks)
+        for pk in pks:
+            if pk not in objects:
+                self.fail('does_not_exist', pk_value=pk)
+        return [objects[pk] for pk in pks]
+
+
+class UserSerializer(SelectFieldsSerializerMixin, TimedSerializerMixin,
+                     serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
     password = serializers.CharField(write_only=True, max_length=150)
     email = serializers.EmailField(
@@ -52,6 +172,8 @@ class UserSerializer(serializers.ModelSerializer):
                         }
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         return (
             self.context.get('request').user.is_authenticated
             and UserFollowing.objects.filter(
@@ -76,7 +198,9 @@ class UserSerializer(serializers.ModelSerializer):
         return instance
 
 
-class UserFollowingSerializer(serializers.ModelSerializer):
+class UserFollowingSerializer(SelectFieldsSerializerMixin,
+                              TimedSerializerMixin,
+                              serializers.ModelSerializer):
     email = serializers.EmailField(source='user_following.email')
     id = serializers.IntegerField(source='user_following.id')
     username = serializers.CharField(source='user_following.username')
@@ -95,15 +219,17 @@ class UserFollowingSerializer(serializers.ModelSerializer):
         recipes_limit = self.context['request'].query_params.get(
             'recipes_limit', None
         )
-        recipes = obj.user_following.recipe_author.all()
+        recipes = obj.user_following.recipe_author.only(
+            'id', 'author', 'name', 'image', 'cooking_time'
+        )
         if recipes_limit is not None:
             recipes = recipes[:int(recipes_limit)]
-        serializer = RecipeSerializer(recipes, many=True, context=self.context)
-        return [{field: recipe[field] for field
-                in ('id', 'name', 'image', 'cooking_time')}
-                for recipe in serializer.data]
+        return SimpleRecipeSerializer(recipes, many=True,
+                                      context=self.context).data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.user_following.recipe_author.count()
 
     def get_is_subscribed(self, obj):
@@ -132,13 +258,36 @@ class ChangePasswordSerializer(serializers.Serializer):
         raise serializers.ValidationError('Incorrect new password')
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class BulkIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BULK_IDS,
+    )
+
+    def validate_ids(self, ids):
+        return list(dict.fromkeys(ids))
+
+
+class ChangesQuerySerializer(serializers.Serializer):
+    since = serializers.CharField(required=False, allow_blank=True)
+    limit = serializers.IntegerField(min_value=1, max_value=MAX_CHANGES,
+                                     default=DEFAULT_CHANGES)
+
+    def validate_since(self, since):
+        try:
+            return decode_cursor(since)
+        except ValueError as error:
+            raise serializers.ValidationError(str(error))
+
+
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Ingredient
         fields = ('id', 'name', 'measurement_unit')
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     id = serializers.IntegerField()
 
     class Meta:
@@ -146,8 +295,9 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'color', 'slug')
 
 
-class RecipeIngredientSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+class RecipeIngredientSerializer(TimedSerializerMixin,
+                                 serializers.ModelSerializer):
+    id = BulkPrimaryKeyRelatedField(queryset=Ingredient.objects.all())
     amount = serializers.IntegerField(max_value=MAX_SMALL_INT_VALUE)
     name = serializers.CharField(source='ingredient.name', required=False)
     measurement_unit = serializers.CharField(
@@ -159,11 +309,6 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         model = RecipeIngredient
         fields = ('id', 'amount', 'name', 'measurement_unit')
 
-    def validate_ingredient(self, ingredient):
-        if not Ingredient.objects.filter(id=ingredient['id']).exists():
-            raise serializers.ValidationError('Object not in database')
-        return ingredient
-
     def validate_amount(self, amount):
         if amount < 1:
             raise serializers.ValidationError('Amount is below 1')
@@ -175,13 +320,14 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         return representation
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(SelectFieldsSerializerMixin, TimedSerializerMixin,
+                       serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     ingredients = RecipeIngredientSerializer(
         source='recipeingredient_set',
         many=True
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all(),
     )
@@ -199,6 +345,8 @@ class RecipeSerializer(serializers.ModelSerializer):
                             'is_in_shopping_cart')
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         return (
             self.context.get('request').user.is_authenticated
             and RecipeFavorite.objects.filter(
@@ -208,6 +356,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         )
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         return (
             self.context.get('request').user.is_authenticated
             and RecipeInShoppingCart.objects.filter(
@@ -236,24 +386,39 @@ class RecipeSerializer(serializers.ModelSerializer):
         ingredient_ids = [ingredient['id'] for ingredient in ingredients_data]
         if len(ingredient_ids) != len(set(ingredient_ids)):
             raise serializers.ValidationError('Ingredients must be unique')
+        id_field = self.fields['ingredients'].child.fields['id']
+        ingredients = id_field.get_queryset().in_bulk(ingredient_ids)
+        errors = [
+            {} if pk in ingredients else {'id': [
+                id_field.error_messages['does_not_exist'].format(pk_value=pk)
+            ]}
+            for pk in ingredient_ids
+        ]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        for ingredient in ingredients_data:
+            ingredient['id'] = ingredients[ingredient['id']]
         return ingredients_data
 
     def __create_ingredients(self, ingredients_data, recipe):
-        for ingredient in ingredients_data:
-            RecipeIngredient.objects.create(
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
                 recipe=recipe,
                 ingredient=ingredient['id'],
                 amount=ingredient['amount']
             )
+            for ingredient in ingredients_data
+        ])
 
     def __update_ingredients(self, ingredients_data, recipe):
+        kept = {ingredient['id'].id for ingredient in ingredients_data}
+        RecipeLinkRemoval.log(ingredient_ids=[
+            pk for pk in recipe.recipeingredient_set.values_list(
+                'ingredient_id', flat=True
+            ) if pk not in kept
+        ])
         recipe.ingredients.clear()
-        for ingredient in ingredients_data:
-            RecipeIngredient.objects.create(
-                recipe=recipe,
-                ingredient=ingredient['id'],
-                amount=ingredient['amount']
-            )
+        self.__create_ingredients(ingredients_data, recipe)
 
     def validate(self, attrs):
         tags = attrs.get('tags')
@@ -262,28 +427,65 @@ class RecipeSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError('All fields have to be present')
         return super().validate(attrs)
 
+    def get_content_hash(self, validated_data, instance=None):
+        def value(field):
+            return validated_data.get(field, getattr(instance, field, None))
+
+        return content_hash(
+            value('name'),
+            value('text'),
+            value('cooking_time'),
+            [(ingredient['id'].id, ingredient['amount'])
+             for ingredient in validated_data['recipeingredient_set']],
+        )
+
+    def save_recipe(self, recipe, **kwargs):
+        """Saves the recipe unless the author has one with the same content.
+
+        The lookup keeps the image from being written for a duplicate,
+        the unique constraint catches concurrent requests.
+        """
+        if Recipe.objects.filter(
+            author=recipe.author,
+            content_hash=recipe.content_hash,
+        ).exclude(pk=recipe.pk).exists():
+            raise serializers.ValidationError(
+                'Recipe with the same details already exists'
+            )
+        image = recipe.image
+        try:
+            with transaction.atomic():
+                recipe.save(**kwargs)
+        except IntegrityError as error:
+            if 'unique_recipe_content' not in str(error):
+                raise
+            raise serializers.ValidationError(
+                'Recipe with the same details already exists'
+            )
+        finally:
+            # Storage moves temporary uploads, closing them skips the
+            # removal of a missing file on garbage collection.
+            image.close()
+
     @transaction.atomic
     def create(self, validated_data):
         validated_data['author'] = self.context['request'].user
+        validated_data['content_hash'] = self.get_content_hash(
+            validated_data
+        )
         ingredients_data = validated_data.pop('recipeingredient_set')
         tags_data = validated_data.pop('tags')
-        duplicate_recipe = Recipe.objects.filter(
-            author=validated_data['author'],
-            name=validated_data['name'],
-            text=validated_data['text'],
-            cooking_time=validated_data['cooking_time']
-        ).first()
-        if duplicate_recipe:
-            raise serializers.ValidationError(
-                'Recipe with the same details already exists'
-            )
-        recipe = Recipe.objects.create(**validated_data)
+        recipe = Recipe(**validated_data)
+        self.save_recipe(recipe, force_insert=True)
         recipe.tags.set(tags_data)
         self.__create_ingredients(ingredients_data, recipe)
         return recipe
 
     @transaction.atomic
     def update(self, instance, validated_data):
+        """Updates the recipe, unchanged ingredients aren't rewritten."""
+        new_hash = self.get_content_hash(validated_data, instance)
+        changed = new_hash != instance.content_hash
         ingredients_data = validated_data.pop('recipeingredient_set')
         tags_data = validated_data.pop('tags')
         instance.author = validated_data.get('author', instance.author)
@@ -292,20 +494,34 @@ class RecipeSerializer(serializers.ModelSerializer):
         instance.text = validated_data.get('text', instance.text)
         instance.cooking_time = validated_data.get('cooking_time',
                                                    instance.cooking_time)
-        instance.save()
+        instance.content_hash = new_hash
+        if changed or 'image' in validated_data:
+            self.save_recipe(instance)
         instance.tags.set(tags_data)
-        self.__update_ingredients(ingredients_data, instance)
+        if changed:
+            self.__update_ingredients(ingredients_data, instance)
         return instance
 
     def to_representation(self, instance):
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
         representation = super().to_representation(instance)
-        tags = instance.tags.all()
-        tags_list = TagSerializer(tags, many=True).data
-        representation['tags'] = tags_list
+        if 'tags' in representation:
+            tags = instance.tags.all()
+            tags_list = TagSerializer(tags, many=True).data
+            representation['tags'] = tags_list
         return representation
 
 
-class SimpleRecipeSerializer(serializers.ModelSerializer):
+class SimpleRecipeSerializer(TimedSerializerMixin,
+                             serializers.ModelSerializer):
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time')
+
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = ('id', 'name', 'status', 'attempts', 'result',
+                  'created_at', 'started_at', 'finished_at')
@@ -0,0 +1,15 @@
+from django.contrib.auth import get_user_model
+
+from jobs.queue import register
+from .views import shopping_cart_text
+
+
+User = get_user_model()
+
+
+@register('shopping_cart')
+def shopping_cart(user_id):
+    return {
+        'filename': 'shopping_cart.txt',
+        'content': shopping_cart_text(User.objects.get(id=user_id)),
+    }
@@ -0,0 +1,45 @@
+import json
+import os
+import tempfile
+
+from django.test import SimpleTestCase, override_settings
+
+from api import metrics
+
+
+class SharedMetricsTest(SimpleTestCase):
+    """Series of other processes are read from METRICS_DIR."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = directory.name
+        settings = override_settings(METRICS_DIR=self.dir)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.counter = metrics.Counter('test_total', 'Test.', ('kind',))
+        self.histogram = metrics.Histogram('test_seconds', 'Test.', (),
+                                           buckets=(1,))
+        self.addCleanup(metrics.REGISTRY.remove, self.counter)
+        self.addCleanup(metrics.REGISTRY.remove, self.histogram)
+
+    def write_process(self, name, content):
+        with open(os.path.join(self.dir, name), 'w') as file:
+            json.dump(content, file)
+
+    def test_processes_are_summed(self):
+        self.counter.inc(('a',), 2)
+        self.histogram.observe((), 0.5)
+        self.write_process('1-exited.json', {
+            'test_total': [[['a'], 3], [['b'], 1]],
+            'test_seconds': [[[], [[0, 1], 2.0, 1]]],
+        })
+        lines = metrics.render_metrics().splitlines()
+        self.assertIn('test_total{kind="a"} 5', lines)
+        self.assertIn('test_total{kind="b"} 1', lines)
+        self.assertIn('test_seconds_bucket{le="1"} 1', lines)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 2', lines)
+        self.assertIn('test_seconds_sum 2.5', lines)
+        own = [name for name in os.listdir(self.dir)
+               if name.startswith(f'{os.getpid()}-')]
+        self.assertEqual(len(own), 1)
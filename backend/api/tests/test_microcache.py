@@ -0,0 +1,32 @@
+from django.core.cache import caches
+from django.test import Client, TestCase, override_settings
+
+from api.middleware import MicroCacheMiddleware
+from recipes.models import Tag
+
+
+@override_settings(ALLOWED_HOSTS=['one.test', 'two.test'],
+                   MICROCACHE_SECONDS=60)
+class MicroCacheTest(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        Tag.objects.create(name='Завтрак', color='#000001', slug='breakfast')
+
+    def get(self, client=None, **extra):
+        response = (client or self.client).get('/api/tags/', **extra)
+        self.assertEqual(response.status_code, 200)
+        return response.get('X-Cache')
+
+    def test_hosts_and_schemes_are_cached_apart(self):
+        self.assertEqual(self.get(HTTP_HOST='one.test'), 'MISS')
+        self.assertEqual(self.get(HTTP_HOST='two.test'), 'MISS')
+        self.assertEqual(self.get(HTTP_HOST='one.test', secure=True),
+                         'MISS')
+        self.assertEqual(self.get(HTTP_HOST='one.test'), 'HIT')
+
+    def test_bypass_skips_the_cache(self):
+        client = Client(**{MicroCacheMiddleware.bypass_key: True})
+        self.assertIsNone(self.get(client, HTTP_HOST='one.test'))
+        self.assertEqual(self.get(HTTP_HOST='one.test'), 'MISS')
+        self.assertIsNone(self.get(client, HTTP_HOST='one.test'))
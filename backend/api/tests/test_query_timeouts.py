@@ -0,0 +1,54 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+
+
+User = get_user_model()
+
+
+@override_settings(MICROCACHE_SECONDS=0)
+class QueryTimeoutTest(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass'
+        )
+        Recipe.objects.create(
+            author=self.admin, name='Суп', text='Сварить',
+            cooking_time=10, image='recipes/soup.png',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def statement_timeout(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW statement_timeout')
+            return cursor.fetchone()[0]
+
+    def test_timeout_is_reset_after_the_request(self):
+        default = self.statement_timeout()
+        self.assertEqual(self.client.get('/api/tags/').status_code, 200)
+        self.assertEqual(self.statement_timeout(), default)
+
+    @override_settings(REQUEST_DEADLINE_SECONDS=0)
+    def test_passed_deadline(self):
+        self.assertEqual(self.client.get('/api/tags/').status_code, 504)
+
+    @override_settings(REQUEST_DEADLINE_SECONDS=0)
+    def test_export_streams_past_the_deadline(self):
+        default = self.statement_timeout()
+        response = self.client.get('/api/recipes/export/')
+        self.assertEqual(response.status_code, 200)
+        timeouts = []
+        lines = []
+        for line in response.streaming_content:
+            timeouts.append(self.statement_timeout())
+            lines.append(json.loads(line))
+        self.assertEqual([line['name'] for line in lines], ['Суп'])
+        self.assertEqual(timeouts, ['1min'])
+        self.assertEqual(self.statement_timeout(), default)
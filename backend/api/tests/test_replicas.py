@@ -0,0 +1,117 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import TransactionTestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from backend import db_routers
+from recipes.models import Recipe, Tag
+
+
+User = get_user_model()
+
+REPLICA = 'replica_1'
+
+
+class ReplicaRoutingTest(TransactionTestCase):
+    """Runs against the test database and a copy of it as the replica.
+
+    Rows written to one database only show where a request read from.
+    """
+
+    # Resolved in setUpClass, after the replica connection is added.
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        primary = connections[DEFAULT_DB_ALIAS]
+        cls.replica_name = primary.settings_dict['NAME'] + '_replica'
+        primary.close()
+        with primary._nodb_cursor() as cursor:
+            cursor.execute(f'DROP DATABASE IF EXISTS {cls.replica_name}')
+            cursor.execute(f'CREATE DATABASE {cls.replica_name} '
+                           f'TEMPLATE {primary.settings_dict["NAME"]}')
+        connections.databases[REPLICA] = {
+            **primary.settings_dict, 'NAME': cls.replica_name,
+        }
+        cls.replica_settings = override_settings(DATABASES={
+            DEFAULT_DB_ALIAS: primary.settings_dict,
+            REPLICA: connections.databases[REPLICA],
+        })
+        cls.replica_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.replica_settings.disable()
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.databases[REPLICA]
+        with connections[DEFAULT_DB_ALIAS]._nodb_cursor() as cursor:
+            cursor.execute(f'DROP DATABASE {cls.replica_name}')
+
+    def setUp(self):
+        caches['default'].clear()
+        db_routers.unhealthy_until.clear()
+        Tag.objects.using(REPLICA).create(name='Реплика', color='#000001',
+                                          slug='replica')
+        self.user = User.objects.create_user(
+            username='cook', email='cook@example.com', password='pass'
+        )
+        User.objects.using(REPLICA).create(
+            id=self.user.id, username='cook', email='cook@example.com',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.recipe = Recipe.objects.create(
+            author=self.user, name='Суп', text='Сварить',
+            cooking_time=10, image='recipes/soup.png',
+        )
+        self.client = APIClient(raise_request_exception=False)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def tearDown(self):
+        # flush skips the replica, the router allows no migrations there.
+        connections[REPLICA].close()
+        Tag.objects.using(REPLICA).all().delete()
+        User.objects.using(REPLICA).all().delete()
+
+    def tag_slugs(self):
+        with override_settings(MICROCACHE_SECONDS=0):
+            response = self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        return [tag['slug'] for tag in response.json()]
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.tag_slugs(), ['replica'])
+
+    def test_write_pins_client_to_primary(self):
+        response = self.client.post(
+            f'/api/recipes/{self.recipe.id}/favorite/'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.tag_slugs(), [])
+
+    def test_unreachable_replica_falls_back_to_primary(self):
+        connections[REPLICA].close()
+        with mock.patch.dict(connections[REPLICA].settings_dict,
+                             {'PORT': 1}):
+            self.assertEqual(self.tag_slugs(), [])
+        self.assertIn(REPLICA, db_routers.unhealthy_until)
+
+    def test_replica_failing_mid_request_is_retried_on_primary(self):
+        pick_replica = db_routers.pick_replica
+
+        def pick_and_kill():
+            alias = pick_replica()
+            pid = connections[alias].connection.get_backend_pid()
+            with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+                cursor.execute('SELECT pg_terminate_backend(%s)', [pid])
+            return alias
+
+        with mock.patch.object(db_routers, 'pick_replica', pick_and_kill):
+            self.assertEqual(self.tag_slugs(), [])
+        self.assertIn(REPLICA, db_routers.unhealthy_until)
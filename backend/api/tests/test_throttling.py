@@ -0,0 +1,82 @@
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+from rest_framework.test import APIRequestFactory
+
+from api.throttling import IPTokenBucketThrottle
+
+
+THREADS = 5
+
+
+class View:
+    throttle_scope = 'test'
+
+
+@override_settings(
+    REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': {'test_ip': '2/s'}}
+)
+class TokenBucketThrottleTest(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.request = APIRequestFactory().post('/', REMOTE_ADDR='10.0.0.1')
+        self.now = 1000.0
+
+    def allow(self):
+        throttle = IPTokenBucketThrottle()
+        with mock.patch.object(throttle, 'timer', lambda: self.now):
+            return throttle.allow_request(self.request, View()), throttle
+
+    def allow_concurrently(self):
+        # Threads get cache objects of their own, sharing the class.
+        cache_class = type(caches['default'])
+        get = cache_class.get
+        results = []
+        barrier = threading.Barrier(THREADS)
+
+        def slow_get(*args, **kwargs):
+            # Widens the window between reading and updating the bucket.
+            value = get(*args, **kwargs)
+            time.sleep(0.005)
+            return value
+
+        def request():
+            barrier.wait()
+            results.append(self.allow()[0])
+
+        threads = [threading.Thread(target=request) for _ in range(THREADS)]
+        with mock.patch.object(cache_class, 'get', slow_get):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return results
+
+    def test_rejects_when_empty_and_refills(self):
+        self.assertTrue(self.allow()[0])
+        self.assertTrue(self.allow()[0])
+        allowed, throttle = self.allow()
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(throttle.wait(), 0.5)
+        self.now += 0.5
+        self.assertTrue(self.allow()[0])
+        self.assertFalse(self.allow()[0])
+
+    def test_refill_stops_at_capacity(self):
+        self.assertTrue(self.allow()[0])
+        self.now += 60
+        self.assertEqual([self.allow()[0] for _ in range(3)],
+                         [True, True, False])
+
+    def test_concurrent_requests_spend_each_token_once(self):
+        self.assertEqual(self.allow_concurrently().count(True), 2)
+
+    def test_concurrent_refills_lose_no_tokens(self):
+        self.assertTrue(self.allow()[0])
+        self.assertTrue(self.allow()[0])
+        self.now += 60
+        self.assertEqual(self.allow_concurrently().count(True), 2)
+        self.assertFalse(self.allow()[0])
@@ -0,0 +1,81 @@
+import threading
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connections
+from django.test import TransactionTestCase
+from rest_framework.test import APIClient
+
+from recipes.models import (Recipe, RecipeFavorite, RecipeInShoppingCart,
+                            UserFollowing)
+
+
+User = get_user_model()
+
+THREADS = 8
+
+
+class ConcurrentToggleTest(TransactionTestCase):
+    """Requests racing on one link create or delete it exactly once."""
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = User.objects.create_user(
+            username='cook', email='cook@example.com', password='pass'
+        )
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Суп', text='Сварить',
+            cooking_time=10, image='recipes/soup.png',
+        )
+
+    def hammer(self, method, path):
+        """Sends the request from THREADS threads at once."""
+        barrier = threading.Barrier(THREADS)
+        statuses = []
+
+        def send():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            barrier.wait()
+            try:
+                statuses.append(getattr(client, method)(path).status_code)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=send) for _ in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(statuses)
+
+    def assert_toggles(self, path, links):
+        self.assertEqual(self.hammer('post', path),
+                         [201] + [400] * (THREADS - 1))
+        self.assertEqual(links.count(), 1)
+        self.assertEqual(self.hammer('delete', path),
+                         [204] + [400] * (THREADS - 1))
+        self.assertEqual(links.count(), 0)
+
+    def test_favorite(self):
+        self.assert_toggles(
+            f'/api/recipes/{self.recipe.id}/favorite/',
+            RecipeFavorite.objects.filter(user=self.user, recipe=self.recipe),
+        )
+
+    def test_shopping_cart(self):
+        self.assert_toggles(
+            f'/api/recipes/{self.recipe.id}/shopping_cart/',
+            RecipeInShoppingCart.objects.filter(user=self.user,
+                                                recipe=self.recipe),
+        )
+
+    def test_subscribe(self):
+        self.assert_toggles(
+            f'/api/users/{self.author.id}/subscribe/',
+            UserFollowing.objects.filter(user_follows=self.user,
+                                         user_following=self.author),
+        )
@@ -0,0 +1,49 @@
+import importlib.util
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from api import warmup
+
+
+def load_gunicorn_config():
+    path = Path(__file__).resolve().parents[2] / 'gunicorn.conf.py'
+    spec = importlib.util.spec_from_file_location('gunicorn_conf', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@override_settings(WARM_UP_ATTEMPTS=2, WARM_UP_RETRY_SECONDS=0.01)
+class WarmUpTest(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.dict(warmup.state,
+                                  {'ready': False, 'duration': None})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_failure_does_not_stop_the_worker(self):
+        database_up = threading.Event()
+
+        def run_warm_up():
+            if not database_up.is_set():
+                raise RuntimeError('database is down')
+
+        config = load_gunicorn_config()
+        with mock.patch.object(warmup, 'run_warm_up', run_warm_up), \
+                self.assertLogs('api.warmup', 'ERROR'):
+            config.post_worker_init(mock.Mock())
+            self.assertFalse(warmup.state['ready'])
+            self.assertEqual(
+                self.client.get('/ready', HTTP_HOST='localhost').status_code,
+                503,
+            )
+            database_up.set()
+            deadline = time.monotonic() + 5
+            while not warmup.state['ready'] and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertTrue(warmup.state['ready'])
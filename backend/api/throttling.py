@@ -0,0 +1,121 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.throttling import BaseThrottle
+
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Token bucket throttle kept in a shared cache.
+
+    The scope is taken from view.throttle_scopes (keyed by action)
+    or view.throttle_scope. Views without a scope are not throttled.
+    The bucket state is a single cache entry, so the check is O(1)
+    and never touches the database.
+
+    The entry counts tokens taken since the epoch, at the refill rate
+    earned(now) tokens have been earned, so a request is allowed if
+    taking one keeps the count at or below that. A count more than the
+    capacity behind is raised first, tokens over the capacity are lost.
+    Only incr and decr change the count, so concurrent requests can't
+    take the same token, and it never goes below what was taken, which
+    memcached decr requires.
+    """
+
+    key_prefix = 'throttle'
+    rate_suffix = ''
+    timer = time.time
+    # An evicted or expired entry starts over with a full bucket.
+    state_seconds = 86400
+
+    def __init__(self):
+        self.cache = caches[settings.THROTTLE_CACHE]
+        self.capacity = None
+        self.refill_rate = None
+        self.tokens = None
+
+    def get_scope(self, view):
+        scopes = getattr(view, 'throttle_scopes', {})
+        action = getattr(view, 'action', None)
+        return scopes.get(action, getattr(view, 'throttle_scope', None))
+
+    def get_rate(self, scope):
+        rates = getattr(settings, 'REST_FRAMEWORK', {}).get(
+            'DEFAULT_THROTTLE_RATES', {}
+        )
+        return rates.get(scope + self.rate_suffix)
+
+    def parse_rate(self, rate):
+        try:
+            num, period = rate.split('/')
+            return int(num), DURATIONS[period[0]]
+        except (ValueError, KeyError, IndexError):
+            raise ImproperlyConfigured(f'Invalid throttle rate "{rate}"')
+
+    def get_cache_ident(self, request):
+        raise NotImplementedError('.get_cache_ident() must be overridden')
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(view)
+        rate = scope and self.get_rate(scope)
+        if not rate:
+            return True
+        self.capacity, duration = self.parse_rate(rate)
+        self.refill_rate = self.capacity / duration
+        key = (f'{self.key_prefix}:{scope}{self.rate_suffix}:'
+               f'{self.get_cache_ident(request)}')
+        earned = self.timer() * self.refill_rate
+        try:
+            taken = self.take(key, int(earned))
+        except ValueError:
+            # The entry was evicted between the calls.
+            return True
+        allowed = taken <= earned
+        self.tokens = earned - taken + (0 if allowed else 1)
+        return allowed
+
+    def take(self, key, earned):
+        """Takes a token, returns the count, given back if over earned."""
+        floor = earned - self.capacity
+        if self.cache.add(key, floor, self.state_seconds):
+            count = floor
+        else:
+            count = self.cache.get(key, floor)
+        if count < floor:
+            # Requests racing here each keep only their part below floor.
+            raised = self.cache.incr(key, floor - count)
+            start = raised - (floor - count)
+            extra = raised - max(start, min(raised, floor))
+            if extra:
+                self.cache.decr(key, extra)
+        taken = self.cache.incr(key)
+        if taken > earned:
+            self.cache.decr(key)
+        return taken
+
+    def wait(self):
+        if self.tokens is None or self.tokens >= 1:
+            return None
+        return (1 - self.tokens) / self.refill_rate
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """Per-user budget, anonymous requests are keyed by client IP."""
+
+    def get_cache_ident(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    """Per-IP budget, read from the '<scope>_ip' rate."""
+
+    rate_suffix = '_ip'
+
+    def get_cache_ident(self, request):
+        return self.get_ident(request)
@@ -1,10 +1,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from djoser.views import TokenCreateView, TokenDestroyView
+from djoser.views import TokenDestroyView
 
 from .views import (
     UserViewSet, PasswordChangeView, IngredientViewSet,
-    TagViewSet, RecipeViewSet
+    TagViewSet, RecipeViewSet, ThrottledTokenCreateView, JobViewSet
 )
 
 router = DefaultRouter()
@@ -12,9 +12,10 @@ router.register('users', UserViewSet)
 router.register('ingredients', IngredientViewSet)
 router.register('tags', TagViewSet)
 router.register('recipes', RecipeViewSet)
+router.register('jobs', JobViewSet, basename='job')
 
 urlpatterns = [
-    path('auth/token/login/', TokenCreateView.as_view(),
+    path('auth/token/login/', ThrottledTokenCreateView.as_view(),
          name='create_token'),
     path('auth/token/logout/', TokenDestroyView.as_view(),
          name='destroy_token'),
@@ -1,27 +1,137 @@
 from rest_framework import (viewsets, generics, status,
                             filters, permissions, mixins)
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import FormParser, JSONParser
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from django.contrib.auth import get_user_model
-from django.shortcuts import get_object_or_404
-from django.http import HttpResponse
+from django.db.models import Count, Exists, OuterRef, Prefetch
+from django.http import HttpResponse, StreamingHttpResponse
+from djoser.views import TokenCreateView
 
 from .serializers import (
     UserSerializer, ChangePasswordSerializer, IngredientSerializer,
     TagSerializer, RecipeSerializer, UserFollowingSerializer,
-    SimpleRecipeSerializer
+    SimpleRecipeSerializer, BulkIdsSerializer, JobSerializer,
+    ChangesQuerySerializer
 )
-from .filters import RecipeFilter
+from .changes import encode_cursor, read_stream
+from .facets import FACETS, get_facets
+from .filters import RecipeFilter, UserSearchFilter
+from .parsers import MultiPartJSONParser
 from .pagination import CustomPagination
 from .permissions import IsOwnerOrReadOnly
 from recipes.models import (Ingredient, Tag, Recipe, UserFollowing,
-                            RecipeFavorite, RecipeInShoppingCart)
+                            RecipeFavorite, RecipeInShoppingCart,
+                            RecipeIngredient, RecipeDeletion)
+from recipes.ndjson import export_lines
+from jobs.models import Job
+from jobs.queue import enqueue
 
 
 User = get_user_model()
 
 
+def bulk_link(request, targets, model, user_field, target_field):
+    """Adds or removes links between request.user and a batch of objects.
+
+    Expects {'ids': [...]} in request data. Runs a constant number of
+    queries whatever the batch size.
+
+    Returns per-item statuses in the order the ids were sent.
+    """
+    serializer = BulkIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = serializer.validated_data['ids']
+    found = set(targets.filter(id__in=ids).values_list('id', flat=True))
+    links = model.objects.filter(**{user_field: request.user})
+    linked = set(links.filter(
+        **{f'{target_field}_id__in': found}
+    ).values_list(f'{target_field}_id', flat=True))
+    if request.method == 'POST':
+        model.objects.bulk_create(
+            [model(**{user_field: request.user, f'{target_field}_id': pk})
+             for pk in found - linked],
+            ignore_conflicts=True,
+        )
+        done, skipped = 'created', 'exists'
+    else:
+        links.filter(**{f'{target_field}_id__in': linked}).delete()
+        done, skipped = 'deleted', 'missing'
+    results = []
+    for pk in ids:
+        if pk not in found:
+            item_status = 'not_found'
+        elif (pk in linked) == (request.method == 'POST'):
+            item_status = skipped
+        else:
+            item_status = done
+        results.append({'id': pk, 'status': item_status})
+    return Response({'results': results})
+
+
+def shopping_cart_text(user):
+    ingredients = {}
+    for user_recipe in RecipeInShoppingCart.objects.filter(user=user):
+        for item in user_recipe.recipe.recipeingredient_set.all():
+            if item.ingredient.name not in ingredients:
+                ingredients[item.ingredient.name] = {
+                    'amount': item.amount,
+                    'measurement_unit': item.ingredient.measurement_unit
+                }
+            else:
+                ingredients[item.ingredient.name]['amount'] += item.amount
+    return ''.join(
+        f"{name} ({data['measurement_unit']}) — {data['amount']} \n"
+        for name, data in ingredients.items()
+    )
+
+
+class SelectFieldsMixin:
+    """Lets GET requests pick the output fields.
+
+    ?fields=id,name outputs only these serializer fields, ?omit=text
+    outputs all but these. Selecting no fields is an error. Views check
+    selected_fields() to skip loading related objects that won't be
+    shown.
+    """
+
+    def selected_fields(self, serializer_class=None):
+        serializer_class = serializer_class or self.get_serializer_class()
+        fields = set(serializer_class.Meta.fields)
+        if self.request.method not in permissions.SAFE_METHODS:
+            return fields
+        selected = fields
+        errors = {}
+        for param in ('fields', 'omit'):
+            if param not in self.request.query_params:
+                continue
+            names = set(filter(None, (
+                name.strip() for name
+                in self.request.query_params[param].split(',')
+            )))
+            if names - fields:
+                errors[param] = [
+                    f'Unknown field {name}' for name in sorted(names - fields)
+                ]
+            elif param == 'fields':
+                selected = selected & names
+            else:
+                selected = selected - names
+            if not errors and not selected:
+                errors[param] = ['At least one field has to be output']
+        if errors:
+            raise ValidationError(errors)
+        return selected
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.selected_fields())
+        return super().get_serializer(*args, **kwargs)
+
+
 class UserViewSet(
+    SelectFieldsMixin,
     mixins.CreateModelMixin,
     mixins.RetrieveModelMixin,
     mixins.ListModelMixin,
@@ -30,7 +140,25 @@ class UserViewSet(
     serializer_class = UserSerializer
     queryset = User.objects.all()
     pagination_class = CustomPagination
+    filter_backends = (UserSearchFilter,)
     permission_classes = (permissions.AllowAny,)
+    lookup_value_regex = r'\d+'
+    throttle_scopes = {
+        'create': 'signup',
+        'subscribe': 'write',
+        'subscribe_bulk': 'write',
+    }
+
+    def get_queryset(self):
+        queryset = User.objects.all()
+        user = self.request.user
+        if user.is_authenticated and 'is_subscribed' in self.selected_fields():
+            queryset = queryset.annotate(
+                is_subscribed=Exists(UserFollowing.objects.filter(
+                    user_follows=user, user_following=OuterRef('pk')
+                ))
+            )
+        return queryset
 
     @action(methods=['GET'], detail=False)
     def me(self, request):
@@ -42,56 +170,91 @@ class UserViewSet(
     @action(methods=['GET'], detail=False)
     def subscriptions(self, request):
         if request.user.is_authenticated:
+            fields = self.selected_fields(UserFollowingSerializer)
             subscriptions = UserFollowing.objects.filter(
                 user_follows=request.user
-            )
+            ).select_related('user_following')
+            if 'recipes_count' in fields:
+                subscriptions = subscriptions.annotate(
+                    recipes_count=Count('user_following__recipe_author')
+                )
             page = self.paginate_queryset(subscriptions)
             serializer = UserFollowingSerializer(page, many=True,
+                                                 fields=fields,
                                                  context={'request': request})
             return self.get_paginated_response(serializer.data)
         return Response(status=status.HTTP_401_UNAUTHORIZED)
 
+    @action(methods=['GET'], detail=False)
+    def suggestions(self, request):
+        """Authors to follow, precomputed by compute_suggestions."""
+        if request.user.is_authenticated:
+            authors = self.get_queryset().filter(
+                suggested_to__user=request.user
+            ).exclude(
+                user_following__user_follows=request.user
+            ).order_by('-suggested_to__score', 'id')
+            page = self.paginate_queryset(authors)
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        return Response(status=status.HTTP_401_UNAUTHORIZED)
+
     @action(methods=['POST', 'DELETE'], detail=True)
     def subscribe(self, request, pk):
         if request.user.is_authenticated:
             if request.method == 'POST':
-                user_to_follow = get_object_or_404(User, id=pk)
-                if user_to_follow == request.user:
+                if int(pk) == request.user.id:
                     return Response({'error': 'Cant follow yourself'},
                                     status=status.HTTP_400_BAD_REQUEST)
-                elif UserFollowing.objects.filter(
-                    user_follows=request.user,
-                    user_following=user_to_follow
-                ).exists():
+                user_to_follow, created = UserFollowing.objects.link(
+                    request.user,
+                    pk,
+                    fields=('id', 'email', 'username',
+                            'first_name', 'last_name'),
+                )
+                if user_to_follow is None:
+                    return Response(status=status.HTTP_404_NOT_FOUND)
+                if not created:
                     return Response({'error': 'Already following'},
                                     status=status.HTTP_400_BAD_REQUEST)
-                user_following = UserFollowing.objects.create(
-                    user_follows=request.user,
-                    user_following=user_to_follow
-                )
                 serializer = UserFollowingSerializer(
-                    user_following,
+                    UserFollowing(user_follows=request.user,
+                                  user_following=user_to_follow),
                     context={'request': request},
                 )
                 return Response(serializer.data,
                                 status=status.HTTP_201_CREATED)
             # DELETE route
-            user_to_unfollow = get_object_or_404(User, id=pk)
-            try:
-                user_following = UserFollowing.objects.get(
-                    user_follows=request.user,
-                    user_following=user_to_unfollow
-                )
-                user_following.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
-            except UserFollowing.DoesNotExist:
+            exists, deleted = UserFollowing.objects.unlink(request.user, pk)
+            if not exists:
+                return Response(status=status.HTTP_404_NOT_FOUND)
+            if not deleted:
                 return Response(status=status.HTTP_400_BAD_REQUEST)
+            return Response(status=status.HTTP_204_NO_CONTENT)
 
         return Response(status=status.HTTP_401_UNAUTHORIZED)
 
+    @action(methods=['POST', 'DELETE'], detail=False,
+            url_path='subscribe/bulk')
+    def subscribe_bulk(self, request):
+        if request.user.is_authenticated:
+            return bulk_link(
+                request,
+                User.objects.exclude(id=request.user.id),
+                UserFollowing,
+                'user_follows',
+                'user_following',
+            )
+        return Response(status=status.HTTP_401_UNAUTHORIZED)
+
+
+class ThrottledTokenCreateView(TokenCreateView):
+    throttle_scope = 'login'
+
 
 class PasswordChangeView(generics.GenericAPIView):
     serializer_class = ChangePasswordSerializer
+    throttle_scope = 'login'
 
     def post(self, request, *args, **kwargs):
         if request.user.is_authenticated:
@@ -119,7 +282,7 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     pagination_class = None
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(SelectFieldsMixin, viewsets.ModelViewSet):
     MODELS = {
         'is_favorited': RecipeFavorite,
         'is_in_shopping_cart': RecipeInShoppingCart
@@ -131,6 +294,25 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filterset_fields = ('author', 'tags')
     pagination_class = CustomPagination
     permission_classes = (IsOwnerOrReadOnly, )
+    parser_classes = (JSONParser, MultiPartJSONParser, FormParser)
+    lookup_value_regex = r'\d+'
+    throttle_scopes = {
+        'create': 'upload',
+        'update': 'upload',
+        'partial_update': 'upload',
+        'destroy': 'write',
+        'favorite': 'write',
+        'shopping_cart': 'write',
+        'favorite_bulk': 'write',
+        'shopping_cart_bulk': 'write',
+    }
+    # Seconds, longer for exports that read everything.
+    statement_timeouts = {
+        'download_shopping_cart': 15,
+        'export': 60,
+    }
+    # Streams for longer than REQUEST_DEADLINE_SECONDS.
+    deadline_exempt_actions = ('export',)
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -138,8 +320,90 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     def get_queryset(self):
-        queryset = Recipe.objects.all()
-        return queryset.distinct()
+        return self.load_related(Recipe.objects.all()).distinct()
+
+    def load_related(self, queryset):
+        """Loads related objects and user flags of selected fields in bulk.
+
+        Columns of fields that aren't selected are deferred.
+        """
+        fields = self.selected_fields()
+        queryset = queryset.defer(*(
+            {'name', 'text', 'image', 'cooking_time'} - fields
+        ))
+        if 'author' in fields:
+            queryset = queryset.select_related('author')
+        if 'tags' in fields:
+            queryset = queryset.prefetch_related('tags')
+        if 'ingredients' in fields:
+            queryset = queryset.prefetch_related(
+                Prefetch('recipeingredient_set',
+                         queryset=RecipeIngredient.objects.select_related(
+                             'ingredient'
+                         ))
+            )
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset
+        flags = {}
+        if 'is_favorited' in fields:
+            flags['is_favorited'] = Exists(RecipeFavorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            ))
+        if 'is_in_shopping_cart' in fields:
+            flags['is_in_shopping_cart'] = Exists(
+                RecipeInShoppingCart.objects.filter(
+                    user=user, recipe=OuterRef('pk')
+                )
+            )
+        if 'author' in fields:
+            flags['author_is_subscribed'] = Exists(
+                UserFollowing.objects.filter(
+                    user_follows=user, user_following=OuterRef('author')
+                )
+            )
+        return queryset.annotate(**flags)
+
+    def list(self, request, *args, **kwargs):
+        """With ?ids=1,2,3 returns these recipes unpaginated, in order.
+
+        ?facets=tags,cooking_time adds counts for the filtered recipes.
+        """
+        if 'ids' not in request.query_params:
+            facets = None
+            if 'facets' in request.query_params:
+                facets = self.get_facet_names()
+            response = super().list(request, *args, **kwargs)
+            if facets:
+                response.data['facets'] = get_facets(
+                    request,
+                    self.filter_queryset(Recipe.objects.all()),
+                    facets,
+                )
+            return response
+        serializer = BulkIdsSerializer(
+            data={'ids': request.query_params['ids'].split(',')}
+        )
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        position = {pk: index for index, pk in enumerate(ids)}
+        recipes = sorted(
+            self.filter_queryset(self.get_queryset()).filter(id__in=ids),
+            key=lambda recipe: position[recipe.id],
+        )
+        return Response(self.get_serializer(recipes, many=True).data)
+
+    def get_facet_names(self):
+        names = tuple(dict.fromkeys(filter(None, (
+            name.strip() for name
+            in self.request.query_params['facets'].split(',')
+        ))))
+        unknown = [name for name in names if name not in FACETS]
+        if not names or unknown:
+            raise ValidationError({'facets': [
+                f'Unknown facet {name}' for name in unknown
+            ] or ['No facets given']})
+        return names
 
     def __get_user_recipe_connection(self, pk, field, request):
         """Handles connections between users and recipes.
@@ -148,40 +412,29 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         Returns relevant response.
         """
-        try:
-            recipe = Recipe.objects.get(id=pk)
-        except Recipe.DoesNotExist:
-            if request.method == 'POST':
-                return Response({'Error': 'Recipe doesnt exist'},
-                                status=status.HTTP_400_BAD_REQUEST)
-            return Response(status=status.HTTP_404_NOT_FOUND)
-        existing_user_recipe = self.__check_existing_user_recipe(
-            request, recipe, field=field
-        )
         model = self.MODELS.get(field)
         if request.method == 'POST':
-            if existing_user_recipe:
-                return Response(status=status.HTTP_400_BAD_REQUEST)
-            model.objects.create(
-                user=request.user,
-                recipe=recipe,
+            recipe, created = model.objects.link(
+                request.user,
+                pk,
+                fields=('id', 'name', 'image', 'cooking_time'),
             )
+            if recipe is None:
+                return Response({'Error': 'Recipe doesnt exist'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            if not created:
+                return Response(status=status.HTTP_400_BAD_REQUEST)
             serializer = SimpleRecipeSerializer(recipe)
             return Response(serializer.data,
                             status=status.HTTP_201_CREATED)
         # DELETE route
-        if not existing_user_recipe:
+        exists, deleted = model.objects.unlink(request.user, pk)
+        if not exists:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        if not deleted:
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        existing_user_recipe.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-    def __check_existing_user_recipe(self, request, recipe, field):
-        model = self.MODELS.get(field)
-        return model.objects.filter(
-            user=request.user,
-            recipe=recipe,
-        ).first()
-
     @action(methods=['POST', 'DELETE'], detail=True)
     def shopping_cart(self, request, pk):
         response = self.__get_user_recipe_connection(
@@ -191,33 +444,30 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
         return response
 
-    def prepare_shopping_cart(self, request):
-        user_recipes = RecipeInShoppingCart.objects.filter(
-            user=request.user,
-        )
-        ingredients = {}
-        for user_recipe in user_recipes:
-            for item in user_recipe.recipe.recipeingredient_set.all():
-                if item.ingredient.name not in ingredients:
-                    ingredients[item.ingredient.name] = {
-                        'amount': item.amount,
-                        'measurement_unit': item.ingredient.measurement_unit
-                    }
-                else:
-                    ingredients[item.ingredient.name]['amount'] += item.amount
-        return ingredients
+    @action(methods=['POST', 'DELETE'], detail=False,
+            url_path='shopping_cart/bulk')
+    def shopping_cart_bulk(self, request):
+        return bulk_link(request, Recipe.objects.all(),
+                         RecipeInShoppingCart, 'user', 'recipe')
 
     @action(methods=['GET'], detail=False)
     def download_shopping_cart(self, request):
+        """Returns the file, or 202 with a job for ?async=1."""
+        if not request.user.is_authenticated:
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+        if request.query_params.get('async') == '1':
+            job = enqueue('shopping_cart', {'user_id': request.user.id},
+                          priority=1, user=request.user)
+            location = reverse('job-detail', args=(job.id,),
+                               request=request)
+            return Response(JobSerializer(job).data,
+                            status=status.HTTP_202_ACCEPTED,
+                            headers={'Location': location})
         response = HttpResponse(content_type='text/plain')
         response['Content-Disposition'] = (
             'attachment; filename="shopping_cart.txt"'
         )
-        ingredients = self.prepare_shopping_cart(request)
-        for name, data in ingredients.items():
-            response.write(
-                f"{name} ({data['measurement_unit']}) — {data['amount']} \n"
-            )
+        response.write(shopping_cart_text(request.user))
         return response
 
     @action(methods=['POST', 'DELETE'], detail=True)
@@ -228,3 +478,80 @@ class RecipeViewSet(viewsets.ModelViewSet):
             request
         )
         return response
+
+    @action(methods=['GET'], detail=False)
+    def trending(self, request):
+        """Recipes by score from update_trending, optionally by ?tags=."""
+        recipes = self.load_related(Recipe.objects.filter(
+            trending_score__isnull=False
+        )).order_by('-trending_score__score', '-id')
+        tags = request.query_params.getlist('tags')
+        if tags:
+            recipes = recipes.filter(Exists(Recipe.tags.through.objects.filter(
+                recipe=OuterRef('pk'),
+                tag__slug__in=tags,
+            )))
+        page = self.paginate_queryset(recipes)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(methods=['GET'], detail=False)
+    def changes(self, request):
+        """Recipes changed and ids deleted after the ?since= cursor.
+
+        Without a cursor starts from the beginning. Clients repeat with
+        the returned cursor while has_more is true.
+        """
+        query = ChangesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        positions = query.validated_data.get('since', [None, None])
+        limit = query.validated_data['limit']
+        recipes, more_recipes = read_stream(
+            self.load_related(Recipe.objects.all()),
+            'updated_at', positions[0], limit,
+        )
+        deletions, more_deletions = read_stream(
+            RecipeDeletion.objects.all(), 'deleted_at', positions[1], limit,
+        )
+        if recipes:
+            positions[0] = (recipes[-1].updated_at, recipes[-1].id)
+        if deletions:
+            positions[1] = (deletions[-1].deleted_at, deletions[-1].id)
+        return Response({
+            'cursor': encode_cursor(positions),
+            'has_more': more_recipes or more_deletions,
+            'updated': self.get_serializer(recipes, many=True).data,
+            'deleted': [deletion.recipe_id for deletion in deletions],
+        })
+
+    @action(methods=['GET'], detail=False,
+            permission_classes=(permissions.IsAdminUser,))
+    def export(self, request):
+        """Streams all recipes as NDJSON, ?images=1 embeds images."""
+        response = StreamingHttpResponse(
+            export_lines(images=request.query_params.get('images') == '1'),
+            content_type='application/x-ndjson; charset=utf-8',
+        )
+        response['Content-Disposition'] = (
+            'attachment; filename="recipes.ndjson"'
+        )
+        return response
+
+    @action(methods=['POST', 'DELETE'], detail=False,
+            url_path='favorite/bulk')
+    def favorite_bulk(self, request):
+        return bulk_link(request, Recipe.objects.all(),
+                         RecipeFavorite, 'user', 'recipe')
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Status of background jobs started by the user."""
+
+    serializer_class = JobSerializer
+    permission_classes = (permissions.IsAuthenticated,)
+    lookup_value_regex = r'\d+'
+
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            return Job.objects.all()
+        return Job.objects.filter(user=self.request.user)
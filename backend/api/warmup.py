@@ -0,0 +1,110 @@
+"""
+Warm-up of a worker process before it takes traffic.
+
+Gunicorn calls warm_up() from post_worker_init (see gunicorn.conf.py),
+the ASGI entry point calls it after the application is built.
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import JsonResponse
+from django.test import Client
+from django.urls import get_resolver, reverse
+
+from .middleware import MicroCacheMiddleware
+from .serializers import (RecipeSerializer, UserSerializer,
+                          UserFollowingSerializer, IngredientSerializer,
+                          TagSerializer)
+
+
+logger = logging.getLogger(__name__)
+
+WARM_UP_PATHS = ('/api/tags/', '/api/ingredients/', '/api/recipes/',
+                 '/api/users/')
+
+state = {'ready': False, 'duration': None}
+
+
+def get_host():
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*':
+            return host.lstrip('.')
+    return 'localhost'
+
+
+def warm_up():
+    """Opens connections and runs sample requests through the stack.
+
+    Replicas are connected lazily by the router, which can fall back
+    to the primary, so only the primary is required here.
+    This loads the tag and ingredient catalogs, builds serializer fields,
+    compiles URL patterns and activates translations. The worker is
+    reported ready only if every step succeeded and every sample request
+    answered below 400. Failed attempts are retried WARM_UP_ATTEMPTS
+    times, then the worker boots anyway, reported not ready, and keeps
+    retrying in a thread every WARM_UP_RETRY_SECONDS. Gunicorn would
+    halt the whole server if its post_worker_init hook raised.
+    """
+    start = time.perf_counter()
+    if not try_warm_up(settings.WARM_UP_ATTEMPTS):
+        threading.Thread(target=retry_warm_up, args=(start,),
+                         daemon=True).start()
+        return
+    mark_ready(start)
+
+
+def try_warm_up(attempts):
+    for attempt in range(1, attempts + 1):
+        try:
+            run_warm_up()
+            return True
+        except Exception:
+            logger.exception('Warm-up attempt %d failed', attempt)
+            connections.close_all()
+            if attempt < attempts:
+                time.sleep(settings.WARM_UP_RETRY_SECONDS)
+    return False
+
+
+def retry_warm_up(start):
+    while True:
+        time.sleep(settings.WARM_UP_RETRY_SECONDS)
+        if try_warm_up(1):
+            break
+    # Connections of this thread aren't used by requests.
+    connections.close_all()
+    mark_ready(start)
+
+
+def mark_ready(start):
+    state['duration'] = time.perf_counter() - start
+    state['ready'] = True
+    logger.info('Warm-up done in %.3fs', state['duration'])
+
+
+def run_warm_up():
+    connections[DEFAULT_DB_ALIAS].ensure_connection()
+    get_resolver().url_patterns
+    reverse('recipe-list')
+    for serializer_class in (RecipeSerializer, UserSerializer,
+                             UserFollowingSerializer,
+                             IngredientSerializer, TagSerializer):
+        serializer_class().fields
+    # Cached responses would leave the views of this worker cold.
+    client = Client(raise_request_exception=False, HTTP_HOST=get_host(),
+                    **{MicroCacheMiddleware.bypass_key: True})
+    for path in WARM_UP_PATHS:
+        status = client.get(path).status_code
+        if status >= 400:
+            raise RuntimeError(f'{path} answered {status}')
+
+
+def readiness_view(request):
+    if state['ready']:
+        return JsonResponse({'status': 'ready',
+                             'warm_up_seconds': state['duration']})
+    return JsonResponse({'status': 'warming up'}, status=503)
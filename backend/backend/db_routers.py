@@ -0,0 +1,69 @@
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.utils import OperationalError
+
+
+# Set by ReplicaRoutingMiddleware to a dict for requests allowed to read
+# from replicas, the chosen alias is kept there so a request reads from
+# one replica only. Everything else reads from the primary.
+replica_state = ContextVar('replica_state', default=None)
+
+# Apps whose rows are read right after being written by another
+# request (tokens after login, sessions), kept on the primary.
+PRIMARY_APPS = {'authtoken', 'sessions', 'admin'}
+
+unhealthy_until = {}
+
+
+def get_replicas():
+    return [alias for alias in settings.DATABASES
+            if alias != DEFAULT_DB_ALIAS]
+
+
+def mark_unhealthy(alias):
+    """Skips the replica for REPLICA_RETRY_SECONDS."""
+    unhealthy_until[alias] = (
+        time.monotonic() + settings.REPLICA_RETRY_SECONDS
+    )
+
+
+def pick_replica():
+    """Returns a reachable replica alias or None to fall back to primary.
+
+    A replica that fails to connect is marked unhealthy.
+    """
+    now = time.monotonic()
+    replicas = [alias for alias in get_replicas()
+                if unhealthy_until.get(alias, 0) <= now]
+    random.shuffle(replicas)
+    for alias in replicas:
+        try:
+            connections[alias].ensure_connection()
+        except OperationalError:
+            mark_unhealthy(alias)
+            continue
+        return alias
+    return None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = replica_state.get()
+        if state is None or model._meta.app_label in PRIMARY_APPS:
+            return None
+        if 'alias' not in state:
+            state['alias'] = pick_replica()
+        return state['alias']
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -21,16 +21,24 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'djoser',
     'rest_framework',
     'rest_framework.authtoken',
     'django_filters',
     'colorfield',
     'api',
-    'recipes'
+    'recipes',
+    'jobs',
 ]
 
 MIDDLEWARE = [
+    'api.middleware.ProfilingMiddleware',
+    'api.middleware.ServerTimingMiddleware',
+    'api.middleware.CompressionMiddleware',
+    'api.middleware.MicroCacheMiddleware',
+    'api.middleware.QueryTimeoutMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -68,10 +76,132 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', 'django'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
     }
 }
 
+# Read replicas as space separated host[:port][/name] entries.
+for number, address in enumerate(
+    os.getenv('DB_REPLICAS', '').split(), start=1
+):
+    address, _, name = address.partition('/')
+    host, _, port = address.partition(':')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'NAME': name or DATABASES['default']['NAME'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['backend.db_routers.ReplicaRouter']
+
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 10))
+
+REPLICA_RETRY_SECONDS = int(os.getenv('REPLICA_RETRY_SECONDS', 30))
+
+# Trending scores, see recipes/management/commands/update_trending.py.
+TRENDING_HALF_LIFE_HOURS = float(os.getenv('TRENDING_HALF_LIFE_HOURS', 24))
+
+TRENDING_WEIGHTS = {
+    'favorite': float(os.getenv('TRENDING_FAVORITE_WEIGHT', 1)),
+    'shopping_cart': float(os.getenv('TRENDING_CART_WEIGHT', 0.5)),
+}
+
+TRENDING_MIN_SCORE = float(os.getenv('TRENDING_MIN_SCORE', 0.01))
+
+# Events younger than this are left to the next run, their transactions
+# may not have committed yet.
+TRENDING_SETTLE_SECONDS = int(os.getenv('TRENDING_SETTLE_SECONDS', 60))
+
+# Number of most carted recipes kept by refresh_analytics.
+ANALYTICS_TOP_RECIPES = int(os.getenv('ANALYTICS_TOP_RECIPES', 1000))
+
+# refresh_analytics leaves changes younger than this to its next run,
+# their transactions may not have committed or replicated yet.
+ANALYTICS_SETTLE_SECONDS = int(os.getenv('ANALYTICS_SETTLE_SECONDS', 60))
+
+# Authors to follow, see recipes/management/commands/compute_suggestions.py.
+SUGGESTIONS_PER_USER = int(os.getenv('SUGGESTIONS_PER_USER', 20))
+
+SUGGESTIONS_PROCESSES = int(os.getenv('SUGGESTIONS_PROCESSES', 2))
+
+# Recipe list facets, see api/facets.py.
+FACETS_CACHE_SECONDS = int(os.getenv('FACETS_CACHE_SECONDS', 60))
+
+# Lower bounds of cooking time histogram buckets, in minutes.
+FACETS_COOKING_TIME_BUCKETS = tuple(int(minutes) for minutes in os.getenv(
+    'FACETS_COOKING_TIME_BUCKETS', '15 30 60 120'
+).split())
+
+# /api/recipes/changes/ skips rows younger than this, see api/changes.py.
+CHANGES_SETTLE_SECONDS = int(os.getenv('CHANGES_SETTLE_SECONDS', 5))
+
+# Directory shared by the processes of /metrics, see api/metrics.py.
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', 1))
+
+# Response compression, see api.middleware.CompressionMiddleware.
+COMPRESSION_MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', 1024))
+
+COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', 6))
+
+COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', 5))
+
+COMPRESSION_CACHE_SECONDS = int(os.getenv('COMPRESSION_CACHE_SECONDS', 300))
+
+# Anonymous response cache, see api.middleware.MicroCacheMiddleware.
+MICROCACHE_SECONDS = float(os.getenv('MICROCACHE_SECONDS', 5))
+
+MICROCACHE_STALE_SECONDS = float(os.getenv('MICROCACHE_STALE_SECONDS', 60))
+
+MICROCACHE_WAIT_SECONDS = float(os.getenv('MICROCACHE_WAIT_SECONDS', 2))
+
+# Query limits, see api.middleware.QueryTimeoutMiddleware.
+STATEMENT_TIMEOUT_SECONDS = float(os.getenv('STATEMENT_TIMEOUT_SECONDS', 5))
+
+REQUEST_DEADLINE_SECONDS = float(os.getenv('REQUEST_DEADLINE_SECONDS', 20))
+
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 100))
+
+# Request profiles, see api/profiling.py.
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', 5))
+
+PROFILE_DIR = os.getenv('PROFILE_DIR', BASE_DIR / 'profiles')
+
+PROFILE_TOKEN_SECONDS = int(os.getenv('PROFILE_TOKEN_SECONDS', 3600))
+
+# Worker warm-up, see api/warmup.py.
+WARM_UP_ATTEMPTS = int(os.getenv('WARM_UP_ATTEMPTS', 5))
+
+WARM_UP_RETRY_SECONDS = float(os.getenv('WARM_UP_RETRY_SECONDS', 2))
+
+# Background jobs, see jobs/queue.py.
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+
+JOB_POLL_SECONDS = float(os.getenv('JOB_POLL_SECONDS', 1))
+
+JOB_RETRY_DELAY_SECONDS = int(os.getenv('JOB_RETRY_DELAY_SECONDS', 30))
+
+# Running jobs older than this are considered lost and queued again.
+JOB_TIMEOUT_SECONDS = int(os.getenv('JOB_TIMEOUT_SECONDS', 600))
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+THROTTLE_CACHE = os.getenv('THROTTLE_CACHE', 'default')
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -105,6 +235,9 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = '/media/'
 
+IMAGE_MAX_BYTES = int(os.getenv('IMAGE_MAX_BYTES', 10 * 1024 * 1024))
+IMAGE_MAX_SIDE = int(os.getenv('IMAGE_MAX_SIDE', 5000))
+
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -121,6 +254,21 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10,
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     'SEARCH_PARAM': 'name',
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.UserTokenBucketThrottle',
+        'api.throttling.IPTokenBucketThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'write': os.getenv('THROTTLE_WRITE', '120/m'),
+        'write_ip': os.getenv('THROTTLE_WRITE_IP', '600/m'),
+        'upload': os.getenv('THROTTLE_UPLOAD', '20/h'),
+        'upload_ip': os.getenv('THROTTLE_UPLOAD_IP', '60/h'),
+        'login': os.getenv('THROTTLE_LOGIN', '10/m'),
+        'login_ip': os.getenv('THROTTLE_LOGIN_IP', '30/m'),
+        'signup': os.getenv('THROTTLE_SIGNUP', '20/h'),
+        'signup_ip': os.getenv('THROTTLE_SIGNUP_IP', '20/h'),
+    },
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 1)),
 }
 
 
@@ -1,7 +1,12 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from api.metrics import metrics_view
+from api.warmup import readiness_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('api/', include('api.urls'))
+    path('api/', include('api.urls')),
+    path('metrics', metrics_view, name='metrics'),
+    path('ready', readiness_view, name='ready'),
 ]
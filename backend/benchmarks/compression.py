@@ -0,0 +1,51 @@
+"""
+Measures bytes sent and CPU time of response compression per endpoint
+for each encoding at the configured levels.
+
+python -m benchmarks.compression --runs 20
+"""
+
+import argparse
+import json
+import os
+import time
+
+
+PATHS = ('/api/recipes/?limit=6', '/api/recipes/?limit=100',
+         '/api/recipes/changes/?limit=500&fields=id,name,cooking_time',
+         '/api/ingredients/', '/api/users/?limit=100')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=20)
+    options = parser.parse_args()
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    import django
+    django.setup()
+    from django.test import Client
+    from api.middleware import brotli, compress
+    from api.warmup import get_host
+
+    encodings = ('gzip', 'br') if brotli is not None else ('gzip',)
+    client = Client(HTTP_HOST=get_host())
+    report = {}
+    for path in PATHS:
+        content = client.get(path).content
+        results = report[path] = {'identity': {'bytes': len(content)}}
+        for encoding in encodings:
+            start = time.process_time()
+            for _ in range(options.runs):
+                compressed = compress(content, encoding)
+            cpu = (time.process_time() - start) / options.runs
+            results[encoding] = {
+                'bytes': len(compressed),
+                'ratio': round(len(content) / len(compressed), 1),
+                'cpu ms': round(cpu * 1000, 2),
+                'MB/s': round(len(content) / cpu / 1024 / 1024, 1),
+            }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Compares full responses with card style ?fields= responses: number of
+queries, response size and latency, for an anonymous and a logged in
+user (the one with most subscriptions).
+
+python -m benchmarks.fields --runs 20
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+
+
+CARD = 'fields=id,name,image,cooking_time'
+
+PATHS = (
+    ('/api/recipes/?limit=20', f'/api/recipes/?limit=20&{CARD}'),
+    ('/api/recipes/?limit=20', '/api/recipes/?limit=20&omit=text,ingredients'),
+    ('/api/users/?limit=20', '/api/users/?limit=20&fields=id,username'),
+    ('/api/users/subscriptions/?limit=6',
+     '/api/users/subscriptions/?limit=6&omit=recipes'),
+)
+
+
+def measure(client, path, runs):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    timings = []
+    for _ in range(runs):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = client.get(path)
+            timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, (path, response.status_code)
+    return {
+        'queries': len(queries),
+        'bytes': len(response.content),
+        'ms': round(statistics.median(timings), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=20)
+    options = parser.parse_args()
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    import django
+    django.setup()
+    from django.contrib.auth import get_user_model
+    from django.db.models import Count
+    from django.test import Client
+    from rest_framework.authtoken.models import Token
+    from api.warmup import get_host
+
+    user = get_user_model().objects.annotate(
+        following=Count('user_follows')
+    ).order_by('-following').first()
+    token, _ = Token.objects.get_or_create(user=user)
+    clients = {
+        'anonymous': Client(HTTP_HOST=get_host()),
+        'user': Client(HTTP_HOST=get_host(),
+                       HTTP_AUTHORIZATION=f'Token {token.key}'),
+    }
+    report = {}
+    for name, client in clients.items():
+        for full, selected in PATHS:
+            if name == 'anonymous' and 'subscriptions' in full:
+                continue
+            report[f'{name} {selected}'] = {
+                'full': measure(client, full, options.runs),
+                'selected': measure(client, selected, options.runs),
+            }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Measures latency of the first requests served by a fresh process,
+with and without warm-up.
+
+python -m benchmarks.first_request --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+PATHS = ('/api/recipes/?limit=6', '/api/tags/', '/api/ingredients/?name=мо',
+         '/api/users/?limit=6')
+
+
+def measure(warm):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    import django
+    django.setup()
+    from django.test import Client
+    from api.warmup import get_host, warm_up
+
+    if warm:
+        warm_up()
+    client = Client(HTTP_HOST=get_host())
+    timings = {}
+    for path in PATHS:
+        start = time.perf_counter()
+        client.get(path)
+        timings[path] = (time.perf_counter() - start) * 1000
+    print(json.dumps(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--child', choices=('cold', 'warm'))
+    options = parser.parse_args()
+    if options.child:
+        return measure(options.child == 'warm')
+    report = {}
+    for mode in ('cold', 'warm'):
+        runs = [json.loads(subprocess.run(
+            [sys.executable, '-m', 'benchmarks.first_request',
+             '--child', mode],
+            capture_output=True, text=True, check=True,
+        ).stdout.splitlines()[-1]) for _ in range(options.runs)]
+        report[mode] = {path: round(statistics.median(
+            run[path] for run in runs
+        ), 2) for path in PATHS}
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Measures peak Python memory of parsing and validating one recipe upload
+with tracemalloc: base64 in JSON, the same with the old one-shot base64
+decoding, and a multipart upload. The image is random noise saved as
+PNG, so its size is close to the requested one.
+
+python -m benchmarks.upload_memory --sizes 1 5 9
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import tracemalloc
+
+
+MB = 1024 * 1024
+
+
+def make_png(size):
+    from PIL import Image
+
+    side = int((size / 3) ** 0.5)
+    buffer = io.BytesIO()
+    Image.frombytes('RGB', (side, side), os.urandom(side * side * 3)).save(
+        buffer, 'PNG', compress_level=0
+    )
+    return buffer.getvalue()
+
+
+def get_serializer_classes():
+    from django.core.files.base import ContentFile
+    from rest_framework import serializers
+    from api.serializers import RecipeSerializer
+
+    class LegacyBase64ImageField(serializers.ImageField):
+        def to_internal_value(self, data):
+            if isinstance(data, str) and data.startswith('data:image'):
+                format, imgstr = data.split(';base64,')
+                ext = format.split('/')[-1]
+                data = ContentFile(base64.b64decode(imgstr),
+                                   name='temp.' + ext)
+            return super().to_internal_value(data)
+
+    class LegacyRecipeSerializer(RecipeSerializer):
+        image = LegacyBase64ImageField()
+
+    return {'json': RecipeSerializer, 'json-legacy': LegacyRecipeSerializer,
+            'multipart': RecipeSerializer}
+
+
+def measure(mode, serializer_class, fields, png):
+    from rest_framework.parsers import JSONParser
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    from api.parsers import MultiPartJSONParser
+
+    factory = APIRequestFactory()
+    if mode == 'multipart':
+        image = io.BytesIO(png)
+        image.name = 'image.png'
+        django_request = factory.post(
+            '/api/recipes/', {'data': json.dumps(fields), 'image': image},
+            format='multipart',
+        )
+    else:
+        django_request = factory.post('/api/recipes/', {
+            **fields,
+            'image': ('data:image/png;base64,'
+                      + base64.b64encode(png).decode()),
+        }, format='json')
+    body = int(django_request.META['CONTENT_LENGTH'])
+    tracemalloc.start()
+    request = Request(django_request,
+                      parsers=(JSONParser(), MultiPartJSONParser()))
+    serializer = serializer_class(data=request.data,
+                                  context={'request': request})
+    valid = serializer.is_valid()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert valid, serializer.errors
+    serializer.validated_data['image'].close()
+    return body, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=float, nargs='+', default=(1, 5, 9),
+                        help='image sizes in MB')
+    options = parser.parse_args()
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    import django
+    django.setup()
+    from recipes.models import Ingredient, Tag
+
+    fields = {
+        'name': 'Benchmark',
+        'text': 'Benchmark',
+        'cooking_time': 10,
+        'tags': list(Tag.objects.values_list('id', flat=True)[:2]),
+        'ingredients': [{'id': pk, 'amount': 1} for pk in
+                        Ingredient.objects.values_list('id', flat=True)[:5]],
+    }
+    serializer_classes = get_serializer_classes()
+    report = {}
+    for size in options.sizes:
+        png = make_png(size * MB)
+        results = report[f'{len(png) / MB:.1f} MB'] = {}
+        for mode, serializer_class in serializer_classes.items():
+            body, peak = measure(mode, serializer_class, fields, png)
+            results[mode] = {
+                'body MB': round(body / MB, 1),
+                'peak MB': round(peak / MB, 1),
+                'peak / image': round(peak / len(png), 2),
+            }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
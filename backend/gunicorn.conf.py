@@ -0,0 +1,17 @@
+import os
+import shutil
+
+bind = '0.0.0.0:8000'
+
+
+def on_starting(server):
+    # Metrics files of a previous run, see api/metrics.py.
+    metrics_dir = os.getenv('METRICS_DIR')
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+def post_worker_init(worker):
+    from api.warmup import warm_up
+
+    warm_up()
@@ -0,0 +1,33 @@
+"""
+Exits with status 0 when the backend on port 8000 reports ready at
+/ready, used as the compose healthcheck of the backend service.
+
+python healthcheck.py
+"""
+
+import os
+import sys
+import urllib.error
+import urllib.request
+
+
+def get_host():
+    # Same choice as api.warmup.get_host(), without loading Django.
+    for host in os.getenv('ALLOWED_HOSTS', '').split():
+        if host != '*':
+            return host.lstrip('.')
+    return 'localhost'
+
+
+def main():
+    request = urllib.request.Request('http://127.0.0.1:8000/ready',
+                                     headers={'Host': get_host()})
+    try:
+        urllib.request.urlopen(request, timeout=5)
+    except (urllib.error.URLError, OSError) as error:
+        print(error, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Run python manage.py run_workers to process background jobs. It starts
+JOB_WORKERS processes (or --processes), each taking one job at a time.
+SIGTERM and SIGINT let running jobs finish before exiting.
+"""
+
+import os
+import signal
+import socket
+import time
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import close_old_connections, connections
+
+from jobs import queue
+
+
+def work(number, poll_seconds, burst):
+    connections.close_all()
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *args: stopping.append(True))
+    signal.signal(signal.SIGINT, lambda *args: stopping.append(True))
+    worker = f'{socket.gethostname()}:{os.getpid()}'
+    last_requeue = 0
+    while not stopping:
+        close_old_connections()
+        if number == 0 and time.monotonic() - last_requeue > poll_seconds:
+            queue.requeue_stale()
+            last_requeue = time.monotonic()
+        job = queue.claim(worker)
+        if job is not None:
+            queue.run(job)
+        elif burst:
+            break
+        else:
+            time.sleep(poll_seconds)
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Runs background job workers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int,
+                            default=settings.JOB_WORKERS)
+        parser.add_argument('--poll-seconds', type=float,
+                            default=settings.JOB_POLL_SECONDS)
+        parser.add_argument('--burst', action='store_true',
+                            help='exit when the queue is empty')
+
+    def handle(self, *args, **options):
+        connections.close_all()
+        context = get_context('fork')
+        processes = [
+            context.Process(target=work, args=(number,
+                                               options['poll_seconds'],
+                                               options['burst']))
+            for number in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+
+        def stop(signum, frame):
+            for process in processes:
+                process.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        for process in processes:
+            process.join()
@@ -0,0 +1,62 @@
+from django.contrib.auth import get_user_model
+from django.db import models
+from django.utils import timezone
+
+
+User = get_user_model()
+
+
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (SUCCEEDED, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField('Обработчик', max_length=200)
+    payload = models.JSONField('Параметры', default=dict, blank=True)
+    status = models.CharField('Статус', max_length=20, choices=STATUSES,
+                              default=QUEUED)
+    priority = models.SmallIntegerField('Приоритет', default=0)
+    run_at = models.DateTimeField('Запустить не раньше',
+                                  default=timezone.now)
+    attempts = models.PositiveSmallIntegerField('Попытки', default=0)
+    max_attempts = models.PositiveSmallIntegerField('Максимум попыток',
+                                                    default=3)
+    result = models.JSONField('Результат', null=True, blank=True)
+    error = models.TextField('Ошибка', blank=True)
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             null=True,
+                             blank=True,
+                             verbose_name='Пользователь')
+    worker = models.CharField('Обработчик очереди', max_length=200,
+                              blank=True)
+    created_at = models.DateTimeField('Создана', auto_now_add=True)
+    started_at = models.DateTimeField('Начата', null=True, blank=True)
+    finished_at = models.DateTimeField('Завершена', null=True, blank=True)
+
+    class Meta:
+        ordering = ('-id',)
+        indexes = [
+            models.Index(
+                fields=['-priority', 'run_at'],
+                condition=models.Q(status='queued'),
+                name='job_queue',
+            ),
+            models.Index(
+                fields=['started_at'],
+                condition=models.Q(status='running'),
+                name='job_running',
+            ),
+        ]
+        verbose_name = 'задача'
+        verbose_name_plural = 'задачи'
+
+    def __str__(self) -> str:
+        return f'{self.name} #{self.id}: {self.get_status_display()}'
@@ -0,0 +1,118 @@
+"""
+Background job queue kept in the Job table.
+
+Handlers are registered with @register in tasks.py of any installed app
+and receive the job payload as keyword arguments, their return value is
+saved as the job result and must be JSON serializable. Workers started
+by run_workers claim jobs with SELECT ... FOR UPDATE SKIP LOCKED, so any
+number of them can share the table without a broker.
+"""
+
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+
+logger = logging.getLogger(__name__)
+
+handlers = {}
+
+
+def register(name):
+    def decorator(handler):
+        handlers[name] = handler
+        return handler
+    return decorator
+
+
+def enqueue(name, payload=None, priority=0, run_at=None, max_attempts=3,
+            user=None):
+    """Creates a queued job, workers see it once the transaction commits."""
+    if name not in handlers:
+        raise KeyError(f'Unknown job handler {name}')
+    return Job.objects.create(
+        name=name,
+        payload=payload or {},
+        priority=priority,
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts,
+        user=user,
+    )
+
+
+def claim(worker):
+    """Marks the next due job as running and returns it, or None."""
+    with transaction.atomic():
+        job = (
+            Job.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=Job.QUEUED, run_at__lte=timezone.now())
+            .order_by('-priority', 'run_at')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = Job.RUNNING
+        job.attempts += 1
+        job.worker = worker
+        job.started_at = timezone.now()
+        job.save(update_fields=('status', 'attempts', 'worker',
+                                'started_at'))
+    return job
+
+
+def run(job):
+    """Runs a claimed job and records the outcome.
+
+    Failed jobs are retried with exponential backoff until max_attempts
+    is reached.
+    """
+    try:
+        job.result = handlers[job.name](**job.payload)
+    except Exception:
+        logger.exception('Job %s failed', job)
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = Job.QUEUED
+            job.run_at = timezone.now() + timedelta(
+                seconds=settings.JOB_RETRY_DELAY_SECONDS
+                * 2 ** (job.attempts - 1)
+            )
+        else:
+            job.status = Job.FAILED
+            job.finished_at = timezone.now()
+    else:
+        job.status = Job.SUCCEEDED
+        job.error = ''
+        job.finished_at = timezone.now()
+    job.save(update_fields=('result', 'error', 'status', 'run_at',
+                            'finished_at'))
+
+
+def requeue_stale():
+    """Returns jobs of crashed workers to the queue.
+
+    Jobs that used up max_attempts are marked failed instead, so a job
+    that crashes its worker isn't retried forever. Returns the number of
+    requeued jobs.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(
+        status=Job.RUNNING,
+        started_at__lt=now - timedelta(seconds=settings.JOB_TIMEOUT_SECONDS),
+    )
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED,
+        error='Worker stopped while running the job',
+        finished_at=now,
+    )
+    return stale.filter(attempts__lt=F('max_attempts')).update(
+        status=Job.QUEUED
+    )
@@ -0,0 +1,9 @@
+from django.core.management import call_command
+
+from .queue import register
+
+
+@register('call_command')
+def run_command(command, args=(), options=None):
+    """Runs a management command, e.g. scheduled update_trending."""
+    call_command(command, *args, **(options or {}))
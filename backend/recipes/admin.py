@@ -1,9 +1,12 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin
+from django.db import IntegrityError, transaction
 
 from .models import (Ingredient, Recipe, RecipeIngredient, UserFollowing,
-                     Tag, RecipeFavorite, RecipeInShoppingCart)
+                     Tag, RecipeFavorite, RecipeInShoppingCart,
+                     IngredientStats, TagStats, RecipeCartStats,
+                     AuthorFollowerStats, RecipeLinkRemoval)
 from .forms import CustomUserCreationForm, CustomChangeForm
 
 
@@ -12,7 +15,9 @@ admin.site.unregister(User)
 
 
 class CustomUserAdmin(UserAdmin):
-    search_fields = ('first_name', 'last_name', 'email')
+    # Same icontains lookups as the trigram indexes of 0012_user_search.
+    search_fields = ('username', 'first_name', 'last_name', 'email')
+    show_full_result_count = False
     add_form = CustomUserCreationForm
     form = CustomChangeForm
 
@@ -53,6 +58,64 @@ class RecipeAdmin(admin.ModelAdmin):
 
     favorited_count.short_description = 'Добавлено в избранное'
 
+    def save_related(self, request, form, formsets, change):
+        recipe = form.instance
+        before = set(recipe.recipeingredient_set.values_list(
+            'ingredient_id', flat=True
+        ))
+        super().save_related(request, form, formsets, change)
+        # For refresh_analytics, inlines may remove or swap ingredients.
+        RecipeLinkRemoval.log(ingredient_ids=before - set(
+            recipe.recipeingredient_set.values_list('ingredient_id',
+                                                    flat=True)
+        ))
+        try:
+            with transaction.atomic():
+                Recipe.objects.filter(pk=recipe.pk).update(
+                    content_hash=recipe.get_content_hash()
+                )
+        except IntegrityError:
+            Recipe.objects.filter(pk=recipe.pk).update(content_hash=None)
+            self.message_user(request,
+                              'У автора уже есть рецепт с таким содержимым',
+                              messages.WARNING)
+
+
+class StatsAdmin(admin.ModelAdmin):
+    """Read-only page over a table filled by refresh_analytics."""
+
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class IngredientStatsAdmin(StatsAdmin):
+    list_display = ('ingredient', 'recipes_count', 'updated_at')
+    list_select_related = ('ingredient',)
+
+
+class TagStatsAdmin(StatsAdmin):
+    list_display = ('tag', 'recipes_count', 'updated_at')
+    list_select_related = ('tag',)
+
+
+class RecipeCartStatsAdmin(StatsAdmin):
+    list_display = ('recipe', 'carts_count', 'favorites_count',
+                    'updated_at')
+    list_select_related = ('recipe',)
+
+
+class AuthorFollowerStatsAdmin(StatsAdmin):
+    list_display = ('day', 'author', 'new_followers', 'followers')
+    list_select_related = ('author',)
+
 
 class IngredientAdmin(admin.ModelAdmin):
     search_fields = ['name']
@@ -66,3 +129,7 @@ admin.site.register(Tag)
 admin.site.register(User, CustomUserAdmin)
 admin.site.register(RecipeFavorite)
 admin.site.register(RecipeInShoppingCart)
+admin.site.register(IngredientStats, IngredientStatsAdmin)
+admin.site.register(TagStats, TagStatsAdmin)
+admin.site.register(RecipeCartStats, RecipeCartStatsAdmin)
+admin.site.register(AuthorFollowerStats, AuthorFollowerStatsAdmin)
@@ -0,0 +1,68 @@
+"""
+Run python manage.py aggregate_profiles to merge the request profiles
+saved in PROFILE_DIR (see api/profiling.py) per route.
+
+For every route the stacks of all its profiles are summed into
+<route>.folded in the output directory, one "stack samples" line each,
+ready for flamegraph.pl or speedscope. Durations and the queries that
+took the most time are printed.
+"""
+
+import json
+import os
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Merges saved request profiles into flame graph input per route.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=settings.PROFILE_DIR,
+                            help='directory of saved profiles')
+        parser.add_argument('--output',
+                            help='directory of .folded files, '
+                                 'defaults to <dir>/folded')
+        parser.add_argument('--route', help='only this route')
+        parser.add_argument('--queries', type=int, default=5,
+                            help='slowest queries printed per route')
+
+    def handle(self, *args, **options):
+        output = options['output'] or os.path.join(options['dir'], 'folded')
+        routes = defaultdict(lambda: {
+            'durations': [], 'stacks': Counter(),
+            'queries': defaultdict(lambda: [0, 0.0]),
+        })
+        for name in sorted(os.listdir(options['dir'])):
+            if not name.endswith('.json'):
+                continue
+            with open(os.path.join(options['dir'], name)) as file:
+                profile = json.load(file)
+            if options['route'] and profile['route'] != options['route']:
+                continue
+            route = routes[profile['route']]
+            route['durations'].append(profile['duration_ms'])
+            route['stacks'].update(profile['stacks'])
+            for query in profile['queries']:
+                stats = route['queries'][query['sql']]
+                stats[0] += 1
+                stats[1] += query['ms']
+        os.makedirs(output, exist_ok=True)
+        for name, route in sorted(routes.items()):
+            with open(os.path.join(output, f'{name}.folded'), 'w') as file:
+                for stack, samples in sorted(route['stacks'].items()):
+                    file.write(f'{stack} {samples}\n')
+            durations = sorted(route['durations'])
+            self.stdout.write(
+                f'{name}: {len(durations)} profiles, '
+                f'median {durations[len(durations) // 2]:.1f} ms, '
+                f'max {durations[-1]:.1f} ms, '
+                f'{sum(route["stacks"].values())} samples'
+            )
+            slowest = sorted(route['queries'].items(),
+                             key=lambda item: item[1][1], reverse=True)
+            for sql, (count, total) in slowest[:options['queries']]:
+                self.stdout.write(f'  {total:9.1f} ms {count:5}x  {sql}')
+        self.stdout.write(f'{len(routes)} routes written to {output}')
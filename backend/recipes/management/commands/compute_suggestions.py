@@ -0,0 +1,94 @@
+"""
+Run python manage.py compute_suggestions on a schedule, e.g. nightly
+from cron, to refresh the authors listed by /api/users/suggestions/.
+
+The follow graph and the authors of favorite recipes are read once,
+from a replica when one is configured, into compact arrays. Worker
+processes forked after loading share them and score users in batches,
+each batch replaces the stored suggestions of its users. Suggestions of
+users who no longer follow anyone are removed at the end.
+"""
+
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from backend.db_routers import pick_replica
+from recipes.models import AuthorSuggestion, RecipeFavorite, UserFollowing
+from recipes.ndjson import batches
+from recipes.suggestions import Adjacency, suggest
+
+
+# Loaded before the pool is forked, so workers get it without copying.
+graph = {}
+
+
+def suggest_batch(user_ids):
+    return [
+        (user_id, suggest(graph['follows'], graph['favorites'], user_id,
+                          graph['limit']))
+        for user_id in user_ids
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Recomputes suggested authors to follow.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int,
+                            default=settings.SUGGESTIONS_PROCESSES)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--limit', type=int,
+                            default=settings.SUGGESTIONS_PER_USER,
+                            help='suggestions kept per user')
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        source = pick_replica() or DEFAULT_DB_ALIAS
+        graph['follows'] = Adjacency(
+            UserFollowing.objects.using(source)
+            .order_by('user_follows_id', 'user_following_id')
+            .values_list('user_follows_id', 'user_following_id')
+            .iterator()
+        )
+        graph['favorites'] = Adjacency(
+            RecipeFavorite.objects.using(source)
+            .order_by('user_id')
+            .values_list('user_id', 'recipe__author_id')
+            .iterator()
+        )
+        graph['limit'] = options['limit']
+        self.stdout.write(
+            f'{len(graph["follows"].targets)} follows, '
+            f'{len(graph["favorites"].targets)} favorites loaded'
+        )
+        connections.close_all()
+        users = 0
+        suggestions = 0
+        with get_context('fork').Pool(options['processes']) as pool:
+            for results in pool.imap_unordered(
+                suggest_batch,
+                batches(graph['follows'].ids, options['batch_size']),
+            ):
+                with transaction.atomic():
+                    AuthorSuggestion.objects.filter(user_id__in=[
+                        user_id for user_id, _ in results
+                    ]).delete()
+                    created = AuthorSuggestion.objects.bulk_create([
+                        AuthorSuggestion(user_id=user_id, author_id=author_id,
+                                         score=score, updated_at=started)
+                        for user_id, authors in results
+                        for author_id, score in authors
+                    ])
+                users += len(results)
+                suggestions += len(created)
+        removed, _ = AuthorSuggestion.objects.filter(
+            updated_at__lt=started
+        ).delete()
+        self.stdout.write(
+            f'{suggestions} suggestions for {users} users, '
+            f'{removed} outdated removed'
+        )
@@ -0,0 +1,30 @@
+"""
+Run python manage.py export_recipes > recipes.ndjson to dump every
+recipe with its author, tags and ingredients as NDJSON. Add --images to
+embed image files as base64, then the dump can be restored with
+import_recipes without copying the media folder.
+"""
+
+from django.core.management import BaseCommand
+
+from recipes.ndjson import CHUNK_SIZE, export_lines
+
+
+class Command(BaseCommand):
+    help = 'Exports recipes as NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-',
+                            help='file name, standard output by default')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--images', action='store_true')
+
+    def handle(self, *args, **options):
+        lines = export_lines(chunk_size=options['chunk_size'],
+                             images=options['images'])
+        if options['output'] == '-':
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf8') as file:
+            file.writelines(lines)
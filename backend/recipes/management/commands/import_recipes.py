@@ -0,0 +1,44 @@
+"""
+Run python manage.py import_recipes recipes.ndjson to load a dump made
+by export_recipes. Every batch is committed in its own transaction, so
+an interrupted import keeps the batches loaded so far, resume it with
+--skip set to the last reported count. Records that clash with existing
+users, tags or recipes are skipped and listed at the end.
+"""
+
+import sys
+from itertools import islice
+
+from django.core.management import BaseCommand
+
+from recipes.ndjson import CHUNK_SIZE, Importer
+
+
+class Command(BaseCommand):
+    help = 'Imports recipes from NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='file name, - for standard input')
+        parser.add_argument('--batch-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--skip', type=int, default=0,
+                            help='number of lines already imported')
+
+    def handle(self, *args, **options):
+        importer = Importer(options['batch_size'])
+        if options['path'] == '-':
+            self.load(importer, sys.stdin, options['skip'])
+        else:
+            with open(options['path'], encoding='utf8') as file:
+                self.load(importer, file, options['skip'])
+        skipped = len(importer.skipped)
+        for number, reason in importer.skipped:
+            self.stderr.write(f'\rRecord {number} skipped: {reason}')
+        self.stdout.write(
+            f'\rImported {importer.count - options["skip"] - skipped} '
+            f'recipes, {skipped} skipped'
+        )
+
+    def load(self, importer, lines, skip):
+        importer.count = skip
+        for count in importer.load(islice(lines, skip, None)):
+            self.stderr.write(f'\r{count}', ending='')
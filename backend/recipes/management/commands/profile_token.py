@@ -0,0 +1,11 @@
+from django.core.management import BaseCommand
+
+from api.profiling import make_token
+
+
+class Command(BaseCommand):
+    help = ('Prints an X-Profile header value that makes requests '
+            'profiled for PROFILE_TOKEN_SECONDS.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_token())
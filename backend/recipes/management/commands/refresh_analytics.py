@@ -0,0 +1,211 @@
+"""
+Run python manage.py refresh_analytics on a schedule, e.g. hourly from
+cron, to refresh the summary tables shown in the admin: ingredient and
+tag usage, most carted recipes and author follower growth.
+
+Aggregates are read from a replica when one is configured. Only rows
+whose numbers changed are written to the primary. Follower growth is
+recounted from the last refreshed day on, earlier days are kept.
+
+The first run, or one with --full, counts everything. Later runs only
+recount what changed since the "analytics" watermark: ingredients and
+tags of recipes updated since, those logged as RecipeLinkRemoval, and
+the stored top recipes together with the ones carted since. If a
+stored top recipe lost enough carts to let in a recipe that wasn't
+recounted, the top is counted in full. The window ends
+ANALYTICS_SETTLE_SECONDS before the clock of the database read from.
+"""
+
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Count, Max, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from backend.db_routers import pick_replica
+from recipes.models import (AuthorFollowerStats, IngredientStats, Recipe,
+                            RecipeCartStats, RecipeFavorite,
+                            RecipeIngredient, RecipeInShoppingCart,
+                            RecipeLinkRemoval, RefreshWatermark, TagStats,
+                            UserFollowing)
+
+
+WATERMARK = 'analytics'
+
+
+def count_by(queryset, field):
+    return dict(queryset.values(field).annotate(
+        count=Count('id')
+    ).values_list(field, 'count'))
+
+
+class Command(BaseCommand):
+    help = 'Refreshes analytics summary tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-recipes', type=int,
+                            default=settings.ANALYTICS_TOP_RECIPES)
+        parser.add_argument('--growth-days', type=int, default=90,
+                            help='days to count on the first run')
+        parser.add_argument('--full', action='store_true',
+                            help='count everything, not only changes')
+
+    def handle(self, *args, **options):
+        self.source = pick_replica() or DEFAULT_DB_ALIAS
+        self.now = timezone.now()
+        with connections[self.source].cursor() as cursor:
+            cursor.execute('SELECT now() - make_interval(secs => %s)',
+                           (settings.ANALYTICS_SETTLE_SECONDS,))
+            self.until = cursor.fetchone()[0]
+        watermarks = RefreshWatermark.objects.filter(name=WATERMARK)
+        watermark = None if options['full'] else watermarks.first()
+        self.since = watermark and watermark.value
+        self.refresh_usage(IngredientStats, RecipeIngredient,
+                           'ingredient_id')
+        self.refresh_usage(TagStats, Recipe.tags.through, 'tag_id')
+        self.refresh_recipes(options['top_recipes'])
+        self.refresh_followers(options['growth_days'])
+        with transaction.atomic():
+            RecipeLinkRemoval.objects.filter(
+                removed_at__lte=self.until
+            ).delete()
+            watermarks.update_or_create(name=WATERMARK,
+                                        defaults={'value': self.until})
+
+    def read(self, model):
+        return model.objects.using(self.source)
+
+    def changed(self, field):
+        """Rows stamped within the window of this run."""
+        return Q(**{f'{field}__gt': self.since, f'{field}__lte': self.until})
+
+    def refresh_usage(self, stats, links, field):
+        """Recounts recipes per ingredient or tag, field of links."""
+        links = self.read(links)
+        queryset = stats.objects.all()
+        if self.since is not None:
+            keys = set(links.filter(
+                recipe__in=self.read(Recipe).filter(self.changed('updated_at'))
+            ).values_list(field, flat=True).distinct())
+            keys.update(self.read(RecipeLinkRemoval).filter(
+                self.changed('removed_at'), **{f'{field}__isnull': False}
+            ).values_list(field, flat=True))
+            links = links.filter(**{f'{field}__in': keys})
+            queryset = queryset.filter(**{f'{field}__in': keys})
+        counts = count_by(links, field)
+        self.sync(queryset, (field,), {
+            (pk,): {'recipes_count': count} for pk, count in counts.items()
+        })
+
+    def count_carts(self, top, **filters):
+        return list(
+            self.read(RecipeInShoppingCart)
+            .filter(**filters)
+            .values('recipe_id')
+            .annotate(count=Count('id'))
+            .order_by('-count', 'recipe_id')
+            .values_list('recipe_id', 'count')[:top]
+        )
+
+    def refresh_recipes(self, top):
+        stored = dict(RecipeCartStats.objects.values_list('recipe_id',
+                                                          'carts_count'))
+        carts = None
+        if self.since is not None:
+            candidates = set(stored).union(
+                self.read(RecipeInShoppingCart)
+                .filter(self.changed('created_at'))
+                .values_list('recipe_id', flat=True)
+            )
+            carts = self.count_carts(top, recipe_id__in=candidates)
+            # Recipes left out have at most the lowest stored count.
+            if len(stored) >= top and (
+                len(carts) < top or carts[-1][1] < min(stored.values())
+            ):
+                carts = None
+        if carts is None:
+            carts = self.count_carts(top)
+        carts = dict(carts)
+        # The replica may lag behind deletions on the primary.
+        existing = set(Recipe.objects.filter(
+            id__in=carts
+        ).values_list('id', flat=True))
+        favorites = count_by(
+            self.read(RecipeFavorite).filter(recipe_id__in=existing),
+            'recipe_id',
+        )
+        self.sync(RecipeCartStats.objects.all(), ('recipe_id',), {
+            (pk,): {'carts_count': carts[pk],
+                    'favorites_count': favorites.get(pk, 0)}
+            for pk in existing
+        })
+
+    def refresh_followers(self, growth_days):
+        last_day = AuthorFollowerStats.objects.aggregate(
+            Max('day')
+        )['day__max'] or (timezone.localdate() - timedelta(growth_days))
+        new_followers = list(
+            self.read(UserFollowing)
+            .filter(created_at__gte=timezone.make_aware(
+                datetime.combine(last_day, time.min)
+            ))
+            .annotate(day=TruncDate('created_at'))
+            .values('user_following_id', 'day')
+            .annotate(count=Count('id'))
+            .values_list('user_following_id', 'day', 'count')
+        )
+        followers = count_by(
+            self.read(UserFollowing).filter(user_following_id__in={
+                author_id for author_id, _, _ in new_followers
+            }),
+            'user_following_id',
+        )
+        self.sync(
+            AuthorFollowerStats.objects.filter(day__gte=last_day),
+            ('author_id', 'day'),
+            {(author_id, day): {'new_followers': count,
+                                'followers': followers[author_id]}
+             for author_id, day, count in new_followers},
+        )
+
+    def sync(self, queryset, key_fields, rows):
+        """Makes the queryset match rows, a dict of key: field values.
+
+        Unchanged rows are left alone, rows of the queryset missing from
+        rows are deleted.
+        """
+        model = queryset.model
+        existing = {
+            tuple(getattr(obj, field) for field in key_fields): obj
+            for obj in queryset
+        }
+        created = []
+        changed = []
+        fields = set()
+        for key, values in rows.items():
+            obj = existing.pop(key, None)
+            if obj is None:
+                created.append(model(updated_at=self.now,
+                                     **dict(zip(key_fields, key)),
+                                     **values))
+            elif any(getattr(obj, field) != value
+                     for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(obj, field, value)
+                obj.updated_at = self.now
+                changed.append(obj)
+                fields.update(values)
+        with transaction.atomic():
+            queryset.filter(
+                pk__in=[obj.pk for obj in existing.values()]
+            ).delete()
+            model.objects.bulk_create(created, batch_size=1000)
+            model.objects.bulk_update(changed, [*fields, 'updated_at'],
+                                      batch_size=1000)
+        self.stdout.write(
+            f'{model._meta.verbose_name_plural}: {len(created)} added, '
+            f'{len(changed)} changed, {len(existing)} removed'
+        )
@@ -0,0 +1,253 @@
+"""
+Run python manage.py seed_benchmark after load_db to fill the database
+with a production sized dataset for performance tests, e.g.
+
+python manage.py seed_benchmark --users 100000 --recipes 1000000 \
+    --favorites 10000000 --carts 10000000 --follows 2000000 --workers 8
+
+Favorites, carts and follows are drawn with a Zipfian popularity skew.
+Duplicate pairs are dropped, so these tables end up slightly smaller
+than requested.
+"""
+
+import io
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate
+from bisect import bisect_left
+from multiprocessing import get_context
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from PIL import Image
+
+from recipes.models import (Ingredient, Tag, Recipe, RecipeIngredient,
+                            RecipeFavorite, RecipeInShoppingCart,
+                            UserFollowing, content_hash)
+
+
+User = get_user_model()
+
+IMAGE_NAME = 'recipes/benchmark.png'
+
+# Favorites, cart additions and follows are spread over this period.
+HISTORY = timedelta(days=30)
+
+# Data shared with worker processes, inherited through fork.
+shared = {}
+
+
+class ZipfSampler:
+    """Draws items so that the k-th most popular one has weight 1 / k^s."""
+
+    def __init__(self, items, exponent):
+        self.items = items
+        self.cum_weights = list(accumulate(
+            1 / rank ** exponent for rank in range(1, len(items) + 1)
+        ))
+
+    def sample(self, rng):
+        point = rng.random() * self.cum_weights[-1]
+        return self.items[bisect_left(self.cum_weights, point)]
+
+
+def init_worker(options, data):
+    connections.close_all()
+    shared.update(data)
+    shared['options'] = options
+    if 'user_ids' in data:
+        shared['authors'] = ZipfSampler(data['user_ids'], 1.1)
+    if 'recipe_ids' in data:
+        shared['recipes'] = ZipfSampler(data['recipe_ids'], 1.0)
+
+
+def chunk_rng(chunk):
+    return random.Random(f"{shared['options']['seed']}:{chunk}")
+
+
+def seed_users(chunk):
+    start, count = chunk
+    prefix = shared['options']['prefix']
+    User.objects.bulk_create(
+        [User(username=f'{prefix}{number}',
+              email=f'{prefix}{number}@example.com',
+              first_name=f'Имя{number}',
+              last_name=f'Фамилия{number}',
+              password=shared['password'])
+         for number in range(start, start + count)],
+        batch_size=count,
+        ignore_conflicts=True,
+    )
+    return count
+
+
+def seed_recipes(chunk):
+    start, count = chunk
+    rng = chunk_rng(chunk)
+    recipes = []
+    amounts = []
+    for number in range(start, start + count):
+        recipe_amounts = [
+            (ingredient_id, rng.randint(1, 1000))
+            for ingredient_id in rng.sample(shared['ingredient_ids'],
+                                            rng.randint(5, 30))
+        ]
+        recipe = Recipe(author_id=shared['authors'].sample(rng),
+                        name=f'Рецепт {number}',
+                        text=f'Описание рецепта {number}. '
+                        * rng.randint(1, 20),
+                        cooking_time=rng.randint(1, 240),
+                        image=IMAGE_NAME)
+        recipe.content_hash = content_hash(recipe.name, recipe.text,
+                                           recipe.cooking_time,
+                                           recipe_amounts)
+        recipes.append(recipe)
+        amounts.append(recipe_amounts)
+    Recipe.objects.bulk_create(recipes, batch_size=count)
+    ingredients = []
+    tags = []
+    for recipe, recipe_amounts in zip(recipes, amounts):
+        for ingredient_id, amount in recipe_amounts:
+            ingredients.append(RecipeIngredient(
+                recipe_id=recipe.id,
+                ingredient_id=ingredient_id,
+                amount=amount,
+            ))
+        for tag_id in rng.sample(shared['tag_ids'], rng.randint(1, 3)):
+            tags.append(Recipe.tags.through(recipe_id=recipe.id,
+                                            tag_id=tag_id))
+    RecipeIngredient.objects.bulk_create(ingredients, batch_size=5000)
+    Recipe.tags.through.objects.bulk_create(tags, batch_size=5000)
+    return count
+
+
+def seed_user_recipes(model, chunk):
+    rng = chunk_rng((model.__name__, chunk))
+    users = shared['user_ids']
+    # Sorted pairs make concurrent workers lock index entries in the same
+    # order, otherwise overlapping batches deadlock.
+    pairs = sorted({(rng.choice(users), shared['recipes'].sample(rng))
+                    for _ in range(chunk[1])})
+    now = timezone.now()
+    model.objects.bulk_create(
+        [model(user_id=user_id, recipe_id=recipe_id,
+               created_at=now - HISTORY * rng.random())
+         for user_id, recipe_id in pairs],
+        batch_size=chunk[1],
+        ignore_conflicts=True,
+    )
+    return chunk[1]
+
+
+def seed_favorites(chunk):
+    return seed_user_recipes(RecipeFavorite, chunk)
+
+
+def seed_carts(chunk):
+    return seed_user_recipes(RecipeInShoppingCart, chunk)
+
+
+def seed_follows(chunk):
+    rng = chunk_rng(('follows', chunk))
+    users = shared['user_ids']
+    pairs = sorted({(rng.choice(users), shared['authors'].sample(rng))
+                    for _ in range(chunk[1])})
+    now = timezone.now()
+    UserFollowing.objects.bulk_create(
+        [UserFollowing(user_follows_id=follower, user_following_id=author,
+                       created_at=now - HISTORY * rng.random())
+         for follower, author in pairs if follower != author],
+        batch_size=chunk[1],
+        ignore_conflicts=True,
+    )
+    return chunk[1]
+
+
+class Command(BaseCommand):
+    help = 'Fills the database with a large generated dataset.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--favorites', type=int, default=100000)
+        parser.add_argument('--carts', type=int, default=100000)
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='bench_')
+
+    def handle(self, *args, **options):
+        ingredient_ids = list(Ingredient.objects.values_list('id',
+                                                             flat=True))
+        if not ingredient_ids:
+            raise CommandError('Ingredient catalog is empty, run load_db')
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.save_image()
+        tag_ids = self.seed_tags(options['tags'])
+        first_user = User.objects.filter(
+            username__startswith=options['prefix']
+        ).count()
+        self.run('users', seed_users, options['users'], start=first_user,
+                 password=make_password('benchmark'))
+        user_ids = self.shuffled(User.objects.all())
+        self.run('recipes', seed_recipes, options['recipes'],
+                 start=Recipe.objects.count(), user_ids=user_ids,
+                 ingredient_ids=ingredient_ids, tag_ids=tag_ids)
+        recipe_ids = self.shuffled(Recipe.objects.all())
+        self.run('favorites', seed_favorites, options['favorites'],
+                 user_ids=user_ids, recipe_ids=recipe_ids)
+        self.run('shopping carts', seed_carts, options['carts'],
+                 user_ids=user_ids, recipe_ids=recipe_ids)
+        self.run('follows', seed_follows, options['follows'],
+                 user_ids=user_ids)
+        self.stdout.write('Success')
+
+    def shuffled(self, queryset):
+        ids = list(queryset.order_by('id').values_list('id', flat=True))
+        self.rng.shuffle(ids)
+        return ids
+
+    def save_image(self):
+        if not default_storage.exists(IMAGE_NAME):
+            buffer = io.BytesIO()
+            Image.new('RGB', (480, 320), '#D8D8D8').save(buffer, 'PNG')
+            default_storage.save(IMAGE_NAME, ContentFile(buffer.getvalue()))
+
+    def seed_tags(self, count):
+        Tag.objects.bulk_create(
+            [Tag(name=f'Тег {number}', slug=f'tag-{number}',
+                 color=f'#{number * 7919 % 0xFFFFFF:06X}')
+             for number in range(count)],
+            ignore_conflicts=True,
+        )
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def run(self, label, task, total, start=0, **data):
+        if total <= 0:
+            return
+        batch_size = self.options['batch_size']
+        chunks = [(number, min(batch_size, start + total - number))
+                  for number in range(start, start + total, batch_size)]
+        began = time.monotonic()
+        connections.close_all()
+        with get_context('fork').Pool(
+            self.options['workers'],
+            initializer=init_worker,
+            initargs=(self.options, data),
+        ) as pool:
+            done = 0
+            for count in pool.imap_unordered(task, chunks):
+                done += count
+                self.stdout.write(f'\r{label}: {done}/{total}', ending='')
+        self.stdout.write(
+            f'\r{label}: {total} in {time.monotonic() - began:.1f}s'
+        )
@@ -0,0 +1,100 @@
+"""
+Run python manage.py update_trending on a schedule, e.g. every five
+minutes from cron, to refresh the scores behind /api/recipes/trending/.
+
+A score is the sum of favorites and cart additions, each weighted by
+TRENDING_WEIGHTS and halved every TRENDING_HALF_LIFE_HOURS. Every run
+decays the stored scores to the current time and adds the events
+created since the previous run, so its cost depends on the new events
+only. Removed favorites are not subtracted, they fade out with the
+decay. Use --rebuild after changing the weights or the half-life.
+
+Events are stamped by the database clock when their transaction starts,
+so the window is read from that clock too and ends
+TRENDING_SETTLE_SECONDS in the past, leaving events that may still
+commit to the next run. Its end is stored as the "trending" watermark.
+"""
+
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+
+from recipes.models import (RecipeFavorite, RecipeInShoppingCart,
+                            RecipeTrendingScore, RefreshWatermark)
+
+
+# Events older than this many half-lives weigh less than 0.1%.
+HORIZON_HALF_LIVES = 10
+
+LOCK_ID = 0x7472656e64  # "trend"
+
+WATERMARK = 'trending'
+
+
+class Command(BaseCommand):
+    help = 'Recomputes time-decayed trending scores of recipes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='drop stored scores and start over')
+
+    def handle(self, *args, **options):
+        half_life = settings.TRENDING_HALF_LIFE_HOURS * 3600
+        params = {
+            'rate': -math.log(2) / half_life,
+            'min_score': settings.TRENDING_MIN_SCORE,
+        }
+        table = RecipeTrendingScore._meta.db_table
+        watermarks = RefreshWatermark.objects.filter(name=WATERMARK)
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Concurrent runs would count the same events twice.
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', (LOCK_ID,))
+            cursor.execute('SELECT now() - make_interval(secs => %s)',
+                           (settings.TRENDING_SETTLE_SECONDS,))
+            params['now'] = cursor.fetchone()[0]
+            if options['rebuild']:
+                cursor.execute(f'DELETE FROM {table}')
+                watermarks.delete()
+            watermark = watermarks.first()
+            params['since'] = watermark.value if watermark else (
+                params['now']
+                - timedelta(seconds=half_life * HORIZON_HALF_LIVES)
+            )
+            cursor.execute(
+                f'UPDATE {table} SET updated_at = %(now)s, score = score'
+                f' * exp(%(rate)s * extract(epoch FROM %(now)s - updated_at))',
+                params,
+            )
+            decayed = cursor.rowcount
+            cursor.execute(self.events_sql(table, params), params)
+            added = cursor.rowcount
+            cursor.execute(f'DELETE FROM {table} WHERE score < %(min_score)s',
+                           params)
+            pruned = cursor.rowcount
+            watermarks.update_or_create(name=WATERMARK,
+                                        defaults={'value': params['now']})
+        self.stdout.write(f'Decayed {decayed}, added {added}, '
+                          f'pruned {pruned} scores')
+
+    def events_sql(self, table, params):
+        events = []
+        for name, model in (('favorite', RecipeFavorite),
+                            ('shopping_cart', RecipeInShoppingCart)):
+            params[f'{name}_weight'] = settings.TRENDING_WEIGHTS[name]
+            events.append(
+                f'SELECT recipe_id, %({name}_weight)s AS weight, created_at'
+                f' FROM {model._meta.db_table}'
+                f' WHERE created_at > %(since)s AND created_at <= %(now)s'
+            )
+        return (
+            f'INSERT INTO {table} (recipe_id, score, updated_at)'
+            f' SELECT recipe_id, sum(weight * exp(%(rate)s'
+            f' * extract(epoch FROM %(now)s - created_at))), %(now)s'
+            f' FROM ({" UNION ALL ".join(events)}) AS events'
+            f' GROUP BY recipe_id'
+            f' ON CONFLICT (recipe_id) DO UPDATE'
+            f' SET score = {table}.score + excluded.score'
+        )
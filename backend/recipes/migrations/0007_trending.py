@@ -0,0 +1,57 @@
+# Generated by Django 3.2.3 on 2026-10-19 08:57
+
+import datetime
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+# Existing rows have no known creation time, they are dated back so they
+# don't all count as trending on the first update_trending run.
+LEGACY_CREATED_AT = datetime.datetime(1970, 1, 1,
+                                      tzinfo=datetime.timezone.utc)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_remove_userfollowing_no_self_following'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeTrendingScore',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending_score', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('score', models.FloatField(db_index=True, verbose_name='Рейтинг')),
+                ('updated_at', models.DateTimeField(verbose_name='Дата расчета')),
+            ],
+            options={
+                'verbose_name': 'рейтинг рецепта',
+                'verbose_name_plural': 'рейтинги рецептов',
+                'ordering': ('-score',),
+            },
+        ),
+        migrations.AddField(
+            model_name='recipefavorite',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=LEGACY_CREATED_AT, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='recipeinshoppingcart',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=LEGACY_CREATED_AT, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='recipefavorite',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+        ),
+        migrations.AlterField(
+            model_name='recipeinshoppingcart',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 3.2.3 on 2026-10-19 09:05
+
+import hashlib
+import json
+from collections import defaultdict
+
+from django.db import migrations, models
+
+CHUNK_SIZE = 2000
+
+
+def content_hash(name, text, cooking_time, ingredients):
+    """recipes.models.content_hash() as of this migration."""
+    content = json.dumps([
+        ' '.join(name.split()),
+        ' '.join(text.split()),
+        cooking_time,
+        sorted([int(ingredient), int(amount)]
+               for ingredient, amount in ingredients),
+    ], ensure_ascii=False)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def fill_content_hash(apps, schema_editor):
+    """Hashes existing recipes.
+
+    Duplicates of the same author keep an empty hash, only the oldest
+    recipe gets it, so the unique constraint can be created.
+    """
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    # Hashes of the current author, recipes are sorted by author.
+    seen = {'author_id': None, 'hashes': set()}
+    chunk = []
+    recipes = Recipe.objects.order_by('author_id', 'id').only(
+        'id', 'author_id', 'name', 'text', 'cooking_time'
+    ).iterator(chunk_size=CHUNK_SIZE)
+    for recipe in recipes:
+        chunk.append(recipe)
+        if len(chunk) == CHUNK_SIZE:
+            hash_chunk(Recipe, RecipeIngredient, chunk, seen)
+            chunk = []
+    hash_chunk(Recipe, RecipeIngredient, chunk, seen)
+
+
+def hash_chunk(Recipe, RecipeIngredient, recipes, seen):
+    ingredients = defaultdict(list)
+    for recipe_id, ingredient_id, amount in RecipeIngredient.objects.filter(
+        recipe_id__in=[recipe.id for recipe in recipes]
+    ).values_list('recipe_id', 'ingredient_id', 'amount'):
+        ingredients[recipe_id].append((ingredient_id, amount))
+    for recipe in recipes:
+        value = content_hash(recipe.name, recipe.text, recipe.cooking_time,
+                             ingredients[recipe.id])
+        if recipe.author_id != seen['author_id']:
+            seen['author_id'] = recipe.author_id
+            seen['hashes'].clear()
+        if value not in seen['hashes']:
+            seen['hashes'].add(value)
+            recipe.content_hash = value
+    Recipe.objects.bulk_update(recipes, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_trending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, verbose_name='Хеш содержимого'),
+        ),
+        migrations.RunPython(fill_content_hash, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='recipe',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='recipe',
+            constraint=models.UniqueConstraint(fields=('author', 'content_hash'), name='unique_recipe_content'),
+        ),
+    ]
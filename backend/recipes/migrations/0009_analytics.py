@@ -0,0 +1,99 @@
+# Generated by Django 3.2.3 on 2026-10-19 09:06
+
+import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+# Existing follows have no known creation time, they are dated back so
+# they don't show up as recent follower growth.
+LEGACY_CREATED_AT = datetime.datetime(1970, 1, 1,
+                                      tzinfo=datetime.timezone.utc)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0008_recipe_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngredientStats',
+            fields=[
+                ('ingredient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('recipes_count', models.PositiveIntegerField(db_index=True, verbose_name='Рецептов')),
+                ('updated_at', models.DateTimeField(verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'популярность ингредиента',
+                'verbose_name_plural': 'популярность ингредиентов',
+                'ordering': ('-recipes_count',),
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipeCartStats',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='cart_stats', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('carts_count', models.PositiveIntegerField(db_index=True, verbose_name='В корзинах')),
+                ('favorites_count', models.PositiveIntegerField(verbose_name='В избранном')),
+                ('updated_at', models.DateTimeField(verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'рецепт в корзинах',
+                'verbose_name_plural': 'рецепты в корзинах',
+                'ordering': ('-carts_count',),
+            },
+        ),
+        migrations.CreateModel(
+            name='TagStats',
+            fields=[
+                ('tag', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='recipes.tag', verbose_name='Тег')),
+                ('recipes_count', models.PositiveIntegerField(db_index=True, verbose_name='Рецептов')),
+                ('updated_at', models.DateTimeField(verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'популярность тега',
+                'verbose_name_plural': 'популярность тегов',
+                'ordering': ('-recipes_count',),
+            },
+        ),
+        migrations.AddField(
+            model_name='userfollowing',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=LEGACY_CREATED_AT, verbose_name='Дата подписки'),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='userfollowing',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Дата подписки'),
+        ),
+        migrations.CreateModel(
+            name='AuthorFollowerStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('new_followers', models.PositiveIntegerField(verbose_name='Новых подписчиков')),
+                ('followers', models.PositiveIntegerField(verbose_name='Всего подписчиков')),
+                ('updated_at', models.DateTimeField(verbose_name='Обновлено')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='follower_stats', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+            options={
+                'verbose_name': 'рост подписчиков',
+                'verbose_name_plural': 'рост подписчиков',
+                'ordering': ('-day', '-new_followers'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='authorfollowerstats',
+            index=models.Index(fields=['-day', '-new_followers'], name='follower_stats_day'),
+        ),
+        migrations.AddConstraint(
+            model_name='authorfollowerstats',
+            constraint=models.UniqueConstraint(fields=('author', 'day'), name='unique_author_follower_stats'),
+        ),
+    ]
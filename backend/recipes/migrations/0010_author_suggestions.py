@@ -0,0 +1,39 @@
+# Generated by Django 3.2.3 on 2026-10-19 09:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0009_analytics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorSuggestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='Рейтинг')),
+                ('updated_at', models.DateTimeField(db_index=True, verbose_name='Дата расчета')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='suggested_to', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='author_suggestions', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'рекомендация автора',
+                'verbose_name_plural': 'рекомендации авторов',
+                'ordering': ('user', '-score'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='authorsuggestion',
+            index=models.Index(fields=['user', '-score'], name='author_suggestion_rank'),
+        ),
+        migrations.AddConstraint(
+            model_name='authorsuggestion',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_author_suggestion'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.2.3 on 2026-10-19 09:17
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_author_suggestions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe_id', models.PositiveBigIntegerField(verbose_name='Рецепт')),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата удаления')),
+            ],
+            options={
+                'verbose_name': 'удаленный рецепт',
+                'verbose_name_plural': 'удаленные рецепты',
+            },
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата изменения'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['updated_at', 'id'], name='recipe_changes'),
+        ),
+        migrations.AddIndex(
+            model_name='recipedeletion',
+            index=models.Index(fields=['deleted_at', 'id'], name='recipe_deletion_changes'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+# Expressions match the SQL of icontains lookups on PostgreSQL, so user
+# search in the API and the admin can use the indexes.
+FIELDS = ('username', 'first_name', 'last_name', 'email')
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('recipes', '0011_recipe_changes'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+    ] + [
+        migrations.RunSQL(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS auth_user_{field}_trgm '
+            f'ON auth_user USING gin (UPPER({field}::text) gin_trgm_ops)',
+            f'DROP INDEX CONCURRENTLY IF EXISTS auth_user_{field}_trgm',
+        )
+        for field in FIELDS
+    ]
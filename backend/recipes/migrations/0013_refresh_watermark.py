@@ -0,0 +1,38 @@
+# Generated by Django 3.2.3 on 2026-10-19 09:38
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def keep_trending_watermark(apps, schema_editor):
+    """Existing scores include the events up to their latest update."""
+    RecipeTrendingScore = apps.get_model('recipes', 'RecipeTrendingScore')
+    RefreshWatermark = apps.get_model('recipes', 'RefreshWatermark')
+    value = RecipeTrendingScore.objects.aggregate(
+        Max('updated_at')
+    )['updated_at__max']
+    if value is not None:
+        RefreshWatermark.objects.create(name='trending', value=value)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_user_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RefreshWatermark',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='Название')),
+                ('value', models.DateTimeField(verbose_name='Обработано до')),
+            ],
+            options={
+                'verbose_name': 'отметка обновления',
+                'verbose_name_plural': 'отметки обновлений',
+            },
+        ),
+        migrations.RunPython(keep_trending_watermark,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.3 on 2026-10-19 09:42
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_refresh_watermark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeLinkRemoval',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ingredient_id', models.PositiveBigIntegerField(null=True, verbose_name='Ингредиент')),
+                ('tag_id', models.PositiveBigIntegerField(null=True, verbose_name='Тег')),
+                ('removed_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Дата удаления')),
+            ],
+            options={
+                'verbose_name': 'удаленная связь рецепта',
+                'verbose_name_plural': 'удаленные связи рецептов',
+            },
+        ),
+    ]
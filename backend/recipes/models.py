@@ -1,6 +1,10 @@
-from django.db import models
+import hashlib
+import json
+
+from django.db import connections, models, router
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from colorfield.fields import ColorField
 
 from .validators import validate_positive
@@ -49,6 +53,21 @@ class Ingredient(models.Model):
         return f'{self.name}, {self.measurement_unit}'
 
 
+def content_hash(name, text, cooking_time, ingredients):
+    """Hash of recipe content, ingredients are (ingredient_id, amount).
+
+    Whitespace differences and ingredient order don't change it.
+    """
+    content = json.dumps([
+        ' '.join(name.split()),
+        ' '.join(text.split()),
+        cooking_time,
+        sorted([int(ingredient), int(amount)]
+               for ingredient, amount in ingredients),
+    ], ensure_ascii=False)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(User,
                                on_delete=models.CASCADE,
@@ -66,15 +85,84 @@ class Recipe(models.Model):
         'Время приготовления',
         validators=(validate_positive,)
     )
+    content_hash = models.CharField('Хеш содержимого', max_length=64,
+                                    null=True, blank=True, editable=False)
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
 
     class Meta:
         ordering = ('-id',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['author', 'content_hash'],
+                name='unique_recipe_content'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['updated_at', 'id'],
+                         name='recipe_changes'),
+        ]
         verbose_name = 'рецепт'
         verbose_name_plural = 'рецепты'
 
     def __str__(self) -> str:
         return self.name
 
+    def get_content_hash(self):
+        return content_hash(
+            self.name,
+            self.text,
+            self.cooking_time,
+            self.recipeingredient_set.values_list('ingredient_id', 'amount'),
+        )
+
+
+class RecipeDeletion(models.Model):
+    """Marker of a deleted recipe for /api/recipes/changes/.
+
+    Written by a post_delete signal, see signals.py.
+    """
+
+    recipe_id = models.PositiveBigIntegerField('Рецепт')
+    deleted_at = models.DateTimeField('Дата удаления', default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at', 'id'],
+                         name='recipe_deletion_changes'),
+        ]
+        verbose_name = 'удаленный рецепт'
+        verbose_name_plural = 'удаленные рецепты'
+
+    def __str__(self) -> str:
+        return f'{self.recipe_id} {self.deleted_at}'
+
+
+class RecipeLinkRemoval(models.Model):
+    """Ingredient or tag removed from a recipe, one of them is set.
+
+    Written where links are removed, see signals.py, for
+    refresh_analytics to recount the recipes of the ingredient or tag.
+    """
+
+    ingredient_id = models.PositiveBigIntegerField('Ингредиент', null=True)
+    tag_id = models.PositiveBigIntegerField('Тег', null=True)
+    removed_at = models.DateTimeField('Дата удаления', default=timezone.now,
+                                      db_index=True)
+
+    class Meta:
+        verbose_name = 'удаленная связь рецепта'
+        verbose_name_plural = 'удаленные связи рецептов'
+
+    def __str__(self) -> str:
+        return f'{self.ingredient_id or self.tag_id} {self.removed_at}'
+
+    @classmethod
+    def log(cls, ingredient_ids=(), tag_ids=()):
+        cls.objects.bulk_create([
+            *(cls(ingredient_id=pk) for pk in ingredient_ids),
+            *(cls(tag_id=pk) for pk in tag_ids),
+        ])
+
 
 class RecipeIngredient(models.Model):
     ingredient = models.ForeignKey(Ingredient,
@@ -102,6 +190,93 @@ class RecipeIngredient(models.Model):
         return f'{self.recipe.name}: {self.ingredient.name}'
 
 
+class LinkQuerySet(models.QuerySet):
+    """Single statement toggles for user links.
+
+    Each method is one INSERT ... ON CONFLICT DO NOTHING or DELETE
+    wrapped in a CTE that also reports whether the target exists,
+    so concurrent requests can't race between check and write.
+    """
+
+    user_field = 'user'
+    target_field = 'recipe'
+    # Set to the name of a creation time field to fill it on link().
+    created_field = None
+
+    def _execute(self, sql, params):
+        db = router.db_for_write(self.model)
+        with connections[db].cursor() as cursor:
+            cursor.execute(sql, params)
+            return db, cursor.fetchone()
+
+    def _names(self):
+        meta = self.model._meta
+        target = meta.get_field(self.target_field)
+        return (
+            meta.db_table,
+            meta.get_field(self.user_field).column,
+            target.column,
+            target.related_model,
+        )
+
+    def link(self, user, target_id, fields=('id',)):
+        """Returns (target or None, created).
+
+        The target is loaded with the given fields in the same statement.
+        """
+        table, user_column, target_column, model = self._names()
+        fields = [field for field in model._meta.concrete_fields
+                  if field.name in fields]
+        columns = ', '.join(field.column for field in fields)
+        link_columns = f'{user_column}, {target_column}'
+        link_values = '%s, id'
+        if self.created_field:
+            link_columns += ', ' + self.model._meta.get_field(
+                self.created_field
+            ).column
+            link_values += ', now()'
+        db, row = self._execute(
+            f'WITH target AS ('
+            f'  SELECT {columns} FROM {model._meta.db_table} WHERE id = %s'
+            f'), link AS ('
+            f'  INSERT INTO {table} ({link_columns})'
+            f'  SELECT {link_values} FROM target'
+            f'  ON CONFLICT DO NOTHING RETURNING id'
+            f') SELECT EXISTS (SELECT 1 FROM link), target.* FROM target',
+            (target_id, user.pk),
+        )
+        if row is None:
+            return None, False
+        target = model.from_db(db, [field.attname for field in fields],
+                               row[1:])
+        return target, row[0]
+
+    def unlink(self, user, target_id):
+        """Returns (target_exists, deleted)."""
+        table, user_column, target_column, model = self._names()
+        return self._execute(
+            f'WITH target AS ('
+            f'  SELECT id FROM {model._meta.db_table} WHERE id = %s'
+            f'), link AS ('
+            f'  DELETE FROM {table} WHERE {user_column} = %s'
+            f'  AND {target_column} IN (SELECT id FROM target)'
+            f'  RETURNING id'
+            f') SELECT EXISTS (SELECT 1 FROM target), '
+            f'EXISTS (SELECT 1 FROM link)',
+            (target_id, user.pk),
+        )[1]
+
+
+class UserRecipeQuerySet(LinkQuerySet):
+    created_field = 'created_at'
+
+
+class UserFollowingQuerySet(LinkQuerySet):
+    user_field = 'user_follows'
+    target_field = 'user_following'
+    created_field = 'created_at'
+
+
 class UserFollowing(models.Model):
     user_follows = models.ForeignKey(
         User,
@@ -114,6 +289,11 @@ class UserFollowing(models.Model):
         related_name='user_following',
         verbose_name='Подписка на пользователя'
     )
+    created_at = models.DateTimeField('Дата подписки',
+                                      default=timezone.now,
+                                      db_index=True)
+
+    objects = UserFollowingQuerySet.as_manager()
 
     class Meta:
         constraints = [
@@ -145,6 +325,11 @@ class AbstractUserRecipe(models.Model):
         Recipe,
         on_delete=models.CASCADE,
         verbose_name='Рецепт')
+    created_at = models.DateTimeField('Дата добавления',
+                                      default=timezone.now,
+                                      db_index=True)
+
+    objects = UserRecipeQuerySet.as_manager()
 
     class Meta:
         abstract = True
@@ -175,3 +360,186 @@ class RecipeInShoppingCart(AbstractUserRecipe):
                 name='unique_recipeinshoppingcart'
             )
         ]
+
+
+class RecipeTrendingScore(models.Model):
+    """Time-decayed popularity of a recipe.
+
+    Filled by the update_trending command, score is valid as of
+    updated_at.
+    """
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='trending_score',
+        verbose_name='Рецепт')
+    score = models.FloatField('Рейтинг', db_index=True)
+    updated_at = models.DateTimeField('Дата расчета')
+
+    class Meta:
+        ordering = ('-score',)
+        verbose_name = 'рейтинг рецепта'
+        verbose_name_plural = 'рейтинги рецептов'
+
+    def __str__(self) -> str:
+        return f'{self.recipe.name}: {self.score:.2f}'
+
+
+class RefreshWatermark(models.Model):
+    """Time up to which a refresh command has processed events.
+
+    Kept apart from the refreshed rows, which may be pruned.
+    """
+
+    name = models.CharField('Название', max_length=50, primary_key=True)
+    value = models.DateTimeField('Обработано до')
+
+    class Meta:
+        verbose_name = 'отметка обновления'
+        verbose_name_plural = 'отметки обновлений'
+
+    def __str__(self) -> str:
+        return f'{self.name}: {self.value}'
+
+
+class IngredientStats(models.Model):
+    """Filled by the refresh_analytics command."""
+
+    ingredient = models.OneToOneField(
+        Ingredient,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Ингредиент')
+    recipes_count = models.PositiveIntegerField('Рецептов', db_index=True)
+    updated_at = models.DateTimeField('Обновлено')
+
+    class Meta:
+        ordering = ('-recipes_count',)
+        verbose_name = 'популярность ингредиента'
+        verbose_name_plural = 'популярность ингредиентов'
+
+    def __str__(self) -> str:
+        return f'{self.ingredient.name}: {self.recipes_count}'
+
+
+class TagStats(models.Model):
+    """Filled by the refresh_analytics command."""
+
+    tag = models.OneToOneField(
+        Tag,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Тег')
+    recipes_count = models.PositiveIntegerField('Рецептов', db_index=True)
+    updated_at = models.DateTimeField('Обновлено')
+
+    class Meta:
+        ordering = ('-recipes_count',)
+        verbose_name = 'популярность тега'
+        verbose_name_plural = 'популярность тегов'
+
+    def __str__(self) -> str:
+        return f'{self.tag.name}: {self.recipes_count}'
+
+
+class RecipeCartStats(models.Model):
+    """Most carted recipes, filled by the refresh_analytics command."""
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='cart_stats',
+        verbose_name='Рецепт')
+    carts_count = models.PositiveIntegerField('В корзинах', db_index=True)
+    favorites_count = models.PositiveIntegerField('В избранном')
+    updated_at = models.DateTimeField('Обновлено')
+
+    class Meta:
+        ordering = ('-carts_count',)
+        verbose_name = 'рецепт в корзинах'
+        verbose_name_plural = 'рецепты в корзинах'
+
+    def __str__(self) -> str:
+        return f'{self.recipe.name}: {self.carts_count}'
+
+
+class AuthorFollowerStats(models.Model):
+    """New followers of an author per day.
+
+    Filled by the refresh_analytics command, followers is the total
+    at the last refresh of that day.
+    """
+
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='follower_stats',
+        verbose_name='Автор')
+    day = models.DateField('День')
+    new_followers = models.PositiveIntegerField('Новых подписчиков')
+    followers = models.PositiveIntegerField('Всего подписчиков')
+    updated_at = models.DateTimeField('Обновлено')
+
+    class Meta:
+        ordering = ('-day', '-new_followers')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['author', 'day'],
+                name='unique_author_follower_stats'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['-day', '-new_followers'],
+                         name='follower_stats_day'),
+        ]
+        verbose_name = 'рост подписчиков'
+        verbose_name_plural = 'рост подписчиков'
+
+    def __str__(self) -> str:
+        return (
+            f'{self.author.get_username()} {self.day}: '
+            f'+{self.new_followers}'
+        )
+
+
+class AuthorSuggestion(models.Model):
+    """Author to follow, filled by the compute_suggestions command."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='author_suggestions',
+        verbose_name='Пользователь')
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='suggested_to',
+        verbose_name='Автор')
+    score = models.FloatField('Рейтинг')
+    updated_at = models.DateTimeField('Дата расчета', db_index=True)
+
+    class Meta:
+        ordering = ('user', '-score')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'],
+                name='unique_author_suggestion'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['user', '-score'],
+                         name='author_suggestion_rank'),
+        ]
+        verbose_name = 'рекомендация автора'
+        verbose_name_plural = 'рекомендации авторов'
+
+    def __str__(self) -> str:
+        return (
+            f'{self.user.get_username()}: '
+            f'{self.author.get_username()} ({self.score:.1f})'
+        )
@@ -0,0 +1,262 @@
+"""
+NDJSON export and import of recipes, one JSON object per line.
+
+Authors, tags and ingredients are referenced by natural keys (email,
+slug, name with measurement unit), so a dump can be loaded into another
+database. Used by the export_recipes and import_recipes commands and by
+/api/recipes/export/.
+"""
+
+import base64
+import json
+import os
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+
+from .models import Ingredient, Recipe, RecipeIngredient, Tag, content_hash
+
+
+User = get_user_model()
+
+CHUNK_SIZE = 2000
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def serialize_recipe(recipe, images=False):
+    author = recipe.author
+    record = {
+        'author': {
+            'email': author.email,
+            'username': author.username,
+            'first_name': author.first_name,
+            'last_name': author.last_name,
+        },
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'tags': [{'name': tag.name, 'slug': tag.slug, 'color': tag.color}
+                 for tag in recipe.tags.all()],
+        'ingredients': [
+            {
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in recipe.recipeingredient_set.all()
+        ],
+        'image': recipe.image.name,
+    }
+    if images and recipe.image:
+        try:
+            with recipe.image.open('rb') as file:
+                record['image_data'] = base64.b64encode(
+                    file.read()
+                ).decode()
+        except FileNotFoundError:
+            pass
+    return record
+
+
+def export_lines(queryset=None, chunk_size=CHUNK_SIZE, images=False):
+    """Yields NDJSON lines for every recipe of the queryset.
+
+    Rows are fetched with a server side cursor and related objects are
+    prefetched for one chunk at a time, so memory doesn't grow with the
+    number of recipes.
+    """
+    if queryset is None:
+        queryset = Recipe.objects.all()
+    queryset = queryset.select_related('author').order_by('id')
+    for chunk in batches(queryset.iterator(chunk_size=chunk_size),
+                         chunk_size):
+        prefetch_related_objects(
+            chunk,
+            'tags',
+            Prefetch('recipeingredient_set',
+                     queryset=RecipeIngredient.objects.select_related(
+                         'ingredient'
+                     ).order_by('id')),
+        )
+        for recipe in chunk:
+            yield json.dumps(serialize_recipe(recipe, images),
+                             ensure_ascii=False) + '\n'
+
+
+class Importer:
+    """Loads NDJSON records, one transaction per batch.
+
+    Missing authors are created with unusable passwords, missing tags
+    and ingredients are created as well. Records that can't be loaded
+    are collected in skipped as (record number, reason): an author or a
+    tag clashing with an existing one on another unique field, or a
+    recipe the author already has with the same content. Images saved
+    for a batch are deleted if it fails.
+    """
+
+    def __init__(self, batch_size=CHUNK_SIZE):
+        self.batch_size = batch_size
+        self.tags = {tag.slug: tag for tag in Tag.objects.all()}
+        self.ingredients = {
+            (ingredient.name, ingredient.measurement_unit): ingredient.id
+            for ingredient in Ingredient.objects.all()
+        }
+        self.count = 0
+        self.skipped = []
+        self.images = []
+
+    def load(self, lines):
+        records = (json.loads(line) for line in lines if line.strip())
+        for batch in batches(records, self.batch_size):
+            self.images = []
+            try:
+                with transaction.atomic():
+                    self.load_batch(batch)
+            except Exception:
+                # Files aren't rolled back with the transaction.
+                for name in self.images:
+                    default_storage.delete(name)
+                raise
+            self.count += len(batch)
+            yield self.count
+
+    def load_batch(self, records):
+        authors = self.get_authors(records)
+        self.create_tags(records)
+        self.create_ingredients(records)
+        numbered = [
+            (self.count + number, record, self.get_content_hash(record))
+            for number, record in enumerate(records, start=1)
+            if self.check(self.count + number, record, authors)
+        ]
+        existing = set(Recipe.objects.filter(
+            author_id__in={authors[record['author']['email']]
+                           for _, record, _ in numbered},
+            content_hash__in={value for _, _, value in numbered},
+        ).values_list('author_id', 'content_hash'))
+        accepted = []
+        for number, record, value in numbered:
+            key = (authors[record['author']['email']], value)
+            if key in existing:
+                self.skipped.append((number, 'duplicate recipe'))
+                continue
+            existing.add(key)
+            accepted.append((record, value))
+        recipes = Recipe.objects.bulk_create([
+            Recipe(
+                author_id=authors[record['author']['email']],
+                name=record['name'],
+                text=record['text'],
+                cooking_time=record['cooking_time'],
+                image=self.get_image(record),
+                content_hash=value,
+            )
+            for record, value in accepted
+        ])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                recipe_id=recipe.id,
+                ingredient_id=self.ingredients[
+                    (item['name'], item['measurement_unit'])
+                ],
+                amount=item['amount'],
+            )
+            for recipe, (record, _) in zip(recipes, accepted)
+            for item in record['ingredients']
+        ])
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe.id,
+                                tag_id=self.tags[tag['slug']].id)
+            for recipe, (record, _) in zip(recipes, accepted)
+            for tag in record['tags']
+        ])
+
+    def check(self, number, record, authors):
+        """Records why the record can't be loaded, if it can't."""
+        email = record['author']['email']
+        if email not in authors:
+            self.skipped.append(
+                (number, f'author {email} clashes with an existing user')
+            )
+            return False
+        for tag in record['tags']:
+            if tag['slug'] not in self.tags:
+                self.skipped.append(
+                    (number, f'tag {tag["slug"]} clashes with an existing tag')
+                )
+                return False
+        return True
+
+    def get_content_hash(self, record):
+        return content_hash(
+            record['name'],
+            record['text'],
+            record['cooking_time'],
+            [(self.ingredients[(item['name'], item['measurement_unit'])],
+              item['amount'])
+             for item in record['ingredients']],
+        )
+
+    def get_authors(self, records):
+        """Returns {email: id}, authors that couldn't be created are left out.
+
+        A new author is skipped by the insert when the username is taken.
+        """
+        authors = {record['author']['email']: record['author']
+                   for record in records}
+        existing = dict(User.objects.filter(
+            email__in=authors
+        ).values_list('email', 'id'))
+        missing = [User(password=make_password(None), **author)
+                   for email, author in authors.items()
+                   if email not in existing]
+        if missing:
+            User.objects.bulk_create(missing, ignore_conflicts=True)
+            existing.update(User.objects.filter(
+                email__in=[author.email for author in missing]
+            ).values_list('email', 'id'))
+        return existing
+
+    def create_tags(self, records):
+        """Tags clashing by name or color with another slug stay missing."""
+        missing = {tag['slug']: Tag(**tag)
+                   for record in records for tag in record['tags']
+                   if tag['slug'] not in self.tags}
+        if missing:
+            Tag.objects.bulk_create(missing.values(), ignore_conflicts=True)
+            self.tags.update({tag.slug: tag for tag in Tag.objects.filter(
+                slug__in=missing
+            )})
+
+    def create_ingredients(self, records):
+        missing = {
+            (item['name'], item['measurement_unit'])
+            for record in records for item in record['ingredients']
+        } - self.ingredients.keys()
+        for ingredient in Ingredient.objects.bulk_create(
+            [Ingredient(name=name, measurement_unit=unit)
+             for name, unit in missing]
+        ):
+            self.ingredients[
+                (ingredient.name, ingredient.measurement_unit)
+            ] = ingredient.id
+
+    def get_image(self, record):
+        if 'image_data' not in record:
+            return record['image']
+        name = default_storage.save(
+            os.path.join('recipes', os.path.basename(record['image'])),
+            ContentFile(base64.b64decode(record['image_data'])),
+        )
+        self.images.append(name)
+        return name
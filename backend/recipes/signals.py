@@ -0,0 +1,81 @@
+"""
+Keeps Recipe.updated_at and deletion markers current for
+/api/recipes/changes/.
+
+Saving a recipe updates updated_at by itself, these handlers cover
+changes that don't save it: tag links, edits and removals of tags and
+ingredients used by recipes, and deletions.
+
+Ingredients and tags taken off recipes are logged as RecipeLinkRemoval
+for refresh_analytics, the recipe no longer leads to them. Ingredients
+are logged in bulk where they are replaced, RecipeSerializer and
+RecipeAdmin, per row signals would stop fast deletes.
+"""
+
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import (Ingredient, Recipe, RecipeDeletion, RecipeLinkRemoval,
+                     Tag)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        recipes = Recipe.objects.filter(pk=instance.pk)
+    elif pk_set is None:
+        recipes = Recipe.objects.filter(tags=instance)
+    else:
+        recipes = Recipe.objects.filter(pk__in=pk_set)
+    recipes.update(updated_at=timezone.now())
+
+
+@receiver((post_save, pre_delete), sender=Tag)
+def tag_changed(sender, instance, created=False, **kwargs):
+    if not created:
+        Recipe.objects.filter(tags=instance).update(
+            updated_at=timezone.now()
+        )
+
+
+@receiver((post_save, pre_delete), sender=Ingredient)
+def ingredient_changed(sender, instance, created=False, **kwargs):
+    if not created:
+        Recipe.objects.filter(ingredients=instance).update(
+            updated_at=timezone.now()
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    RecipeDeletion.objects.create(recipe_id=instance.pk)
+
+
+# Deletes of the generated tags table send no delete signals.
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_removed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if action not in ('post_remove', 'pre_clear'):
+        return
+    if reverse:
+        tag_ids = [instance.pk]
+    elif pk_set is None:
+        tag_ids = instance.tags.values_list('id', flat=True)
+    else:
+        tag_ids = pk_set
+    RecipeLinkRemoval.log(tag_ids=tag_ids)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    RecipeLinkRemoval.log(
+        ingredient_ids=instance.recipeingredient_set.values_list(
+            'ingredient_id', flat=True
+        ),
+        tag_ids=instance.tags.values_list('id', flat=True),
+    )
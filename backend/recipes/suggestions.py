@@ -0,0 +1,63 @@
+"""
+Authors to follow, computed from the follow graph.
+
+Candidates are the authors followed by the people a user follows. Each
+path counts once and is weighted up by the user's favorites among the
+author's recipes. Authors the user already follows are left out. Used by
+the compute_suggestions command, the API reads the stored results.
+"""
+
+import heapq
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+
+class Adjacency:
+    """Directed edges as compact arrays.
+
+    Sources are kept sorted in ids, the targets of ids[i] are
+    targets[offsets[i]:offsets[i + 1]]. Edges must come sorted by source.
+    """
+
+    def __init__(self, edges):
+        self.ids = array('q')
+        self.offsets = array('q', [0])
+        self.targets = array('q')
+        for source, target in edges:
+            if not self.ids or self.ids[-1] != source:
+                if self.ids:
+                    self.offsets.append(len(self.targets))
+                self.ids.append(source)
+            self.targets.append(target)
+        self.offsets.append(len(self.targets))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def neighbors(self, source):
+        index = bisect_left(self.ids, source)
+        if index == len(self.ids) or self.ids[index] != source:
+            return self.targets[:0]
+        return self.targets[self.offsets[index]:self.offsets[index + 1]]
+
+
+def suggest(follows, favorites, user_id, limit):
+    """Returns up to limit (author_id, score) pairs, best first.
+
+    follows links users to the authors they follow, favorites links
+    users to the authors of their favorite recipes, once per recipe.
+    """
+    following = follows.neighbors(user_id)
+    paths = Counter()
+    for followed in following:
+        paths.update(follows.neighbors(followed))
+    for author in (user_id, *following):
+        paths.pop(author, None)
+    favorited = Counter(favorites.neighbors(user_id))
+    return heapq.nlargest(
+        limit,
+        ((author, count * (1 + favorited[author]))
+         for author, count in paths.items()),
+        key=lambda item: (item[1], -item[0]),
+    )
@@ -0,0 +1,84 @@
+"""
+Request templates taken from the postman collection.
+
+Requests are addressed by their folder path and name, e.g.
+'recipes/get_recipes/get_recipes_list // No Auth'. Postman variables
+are filled from a dict of values when a request is rendered.
+"""
+
+import json
+import re
+from pathlib import Path
+from urllib.parse import urlsplit
+
+
+COLLECTION = (Path(__file__).resolve().parent.parent
+              / 'postman-collection' / 'diploma.postman_collection.json')
+
+VARIABLE = re.compile(r'{{(\w+)}}')
+QUOTED_VARIABLE = re.compile(r'"{{(\w+)}}"')
+
+
+class Template:
+    def __init__(self, method, url, body=None, auth=False):
+        self.method = method
+        self.url = url
+        self.body = body
+        self.auth = auth
+
+    @property
+    def key(self):
+        """Endpoint name used in reports, e.g. 'GET /api/recipes/{id}/'."""
+        parts = urlsplit(VARIABLE.sub('{id}', self.url.replace(
+            '{{baseUrl}}', ''
+        )))
+        key = f'{self.method} {parts.path}'
+        if parts.query:
+            names = sorted({pair.split('=')[0]
+                            for pair in parts.query.split('&')})
+            key += '?' + '&'.join(names)
+        return key
+
+    def render(self, variables, body=None):
+        url = VARIABLE.sub(lambda match: str(variables[match[1]]),
+                           self.url)
+        data = None
+        if self.body:
+            raw = QUOTED_VARIABLE.sub(
+                lambda match: json.dumps(str(variables[match[1]])),
+                self.body,
+            )
+            raw = VARIABLE.sub(
+                lambda match: json.dumps(variables[match[1]]), raw
+            )
+            data = json.loads(raw)
+        if body:
+            data = {**(data or {}), **{
+                name: value(variables) if callable(value) else value
+                for name, value in body.items()
+            }}
+        return url.strip(), data
+
+
+def load(path=COLLECTION):
+    with open(path, encoding='utf8') as file:
+        collection = json.load(file)
+    templates = {}
+
+    def walk(items, folder):
+        for item in items:
+            name = '/'.join(folder + [item['name']])
+            if 'item' in item:
+                walk(item['item'], folder + [item['name']])
+                continue
+            request = item['request']
+            url = request['url']
+            templates[name] = Template(
+                request['method'],
+                url['raw'] if isinstance(url, dict) else url,
+                (request.get('body') or {}).get('raw') or None,
+                (request.get('auth') or {}).get('type') == 'apikey',
+            )
+
+    walk(collection['item'], [])
+    return templates
@@ -0,0 +1,56 @@
+"""
+Compares two load test reports, e.g. from the base and the head commit.
+
+python loadtest/compare.py base.json head.json --threshold 10
+
+Exits with status 1 when p95 latency of an endpoint grows by more than
+the threshold (percent) or its error rate goes up.
+"""
+
+import argparse
+import json
+import sys
+
+
+def change(before, after):
+    if not before:
+        return 0.0
+    return (after - before) / before * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('base', type=argparse.FileType())
+    parser.add_argument('head', type=argparse.FileType())
+    parser.add_argument('--threshold', type=float, default=10)
+    options = parser.parse_args()
+    base = json.load(options.base)
+    head = json.load(options.head)
+
+    regressions = []
+    print(f"{'endpoint':<60} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}"
+          f" {'errors':>8}")
+    for key in sorted(set(base['endpoints']) | set(head['endpoints'])):
+        before = base['endpoints'].get(key)
+        after = head['endpoints'].get(key)
+        if not before or not after:
+            print(f"{key:<60} only in {'head' if after else 'base'}")
+            continue
+        p95 = change(before['p95_ms'], after['p95_ms'])
+        print(f"{key:<60} {change(before['rps'], after['rps']):>+7.1f}%"
+              f" {change(before['p50_ms'], after['p50_ms']):>+7.1f}%"
+              f" {p95:>+7.1f}%"
+              f" {change(before['p99_ms'], after['p99_ms']):>+7.1f}%"
+              f" {(after['error_rate'] - before['error_rate']) * 100:>+7.2f}"
+              f"pp")
+        if p95 > options.threshold or (
+            after['error_rate'] > before['error_rate']
+        ):
+            regressions.append(key)
+    if regressions:
+        print('\nRegressions:\n' + '\n'.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
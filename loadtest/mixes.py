@@ -0,0 +1,151 @@
+"""
+Traffic mixes for the load test.
+
+A mix is a list of (weight, task) pairs. A task is a list of calls made
+one after another by the same virtual user. A call names a request from
+the postman collection or defines its own template for routes the
+collection doesn't cover.
+"""
+
+import uuid
+
+from collection import Template
+
+
+class Call:
+    def __init__(self, request, expect=(200,), body=None, save=None,
+                 **variables):
+        self.request = request
+        self.expect = expect
+        self.body = body
+        self.save = save
+        self.variables = variables
+
+
+def unique_name(variables):
+    return f'Нагрузочный рецепт {uuid.uuid4().hex[:12]}'
+
+
+def bulk_ids(variables):
+    return variables['random_recipes'](20)
+
+
+RECIPE_LIST = 'recipes/get_recipes/get_recipes_list // No Auth'
+BULK_CART = Template('POST', '{{baseUrl}}/api/recipes/shopping_cart/bulk/',
+                     auth=True)
+BULK_CART_DELETE = Template(
+    'DELETE', '{{baseUrl}}/api/recipes/shopping_cart/bulk/', auth=True
+)
+BULK_FAVORITE = Template('POST', '{{baseUrl}}/api/recipes/favorite/bulk/',
+                         auth=True)
+BULK_SUBSCRIBE = Template('POST', '{{baseUrl}}/api/users/subscribe/bulk/',
+                          auth=True)
+RECIPE_PAGE = Template('GET', '{{baseUrl}}/api/recipes/?page={{page}}')
+
+
+ANONYMOUS = [
+    (30, [Call(RECIPE_LIST)]),
+    (15, [Call(RECIPE_PAGE)]),
+    (25, [Call('recipes/get_recipes/get_recipe_detail // No Auth')]),
+    (10, [Call('tags/get_tags_info/get_tag_list // No Auth')]),
+    (3, [Call('tags/get_tags_info/get_tag_detail // No Auth')]),
+    (5, [Call('ingredients/get_ingradients/'
+              'get_ingredients_list // No Auth')]),
+    (2, [Call('ingredients/get_ingradients/get_ingredient // No Auth')]),
+    (5, [Call('users/get_user_info/get_user_list // No Auth')]),
+    (5, [Call('users/get_user_info/get_profile // No Auth')]),
+]
+
+FILTERED = [
+    (20, [Call('recipes/get_recipes/get_recipes_list // User')]),
+    (10, [Call('recipes/get_recipes/'
+               'get_recipes_list_with_limit_param // User')]),
+    (20, [Call('recipes/get_recipes/'
+               'get_recipes_list_with_author_param // User')]),
+    (25, [Call('recipes/get_recipes/'
+               'get_recipes_list_with_two_tags_param // User')]),
+    (10, [Call('recipe_filters_for_favorite_and_shopping_cart/'
+               'get_recipes_list_with_is_favorited_param // User')]),
+    (10, [Call('recipe_filters_for_favorite_and_shopping_cart/'
+               'get_recipes_list_with_is_in_shopping_cart_param // User')]),
+    (5, [Call('recipes/get_recipes/get_recipe_detail // User')]),
+]
+
+AUTOCOMPLETE = [
+    (1, [Call('ingredients/get_ingradients/'
+              'get_ingredients_list_with_name_filter // User')]),
+]
+
+CART = [
+    (10, [
+        Call('shopping_cart/add_to_shopping_cart/'
+             'add_to_shopping_cart // User', expect=(201, 400)),
+        Call('shopping_cart/download_shopping_cart/'
+             'download_shopping_cart // User'),
+        Call('delete_requests/shopping_cart/'
+             'remove_from_shopping_cart // User', expect=(204, 400)),
+    ]),
+    (3, [
+        Call(BULK_CART, body={'ids': bulk_ids}),
+        Call('shopping_cart/download_shopping_cart/'
+             'download_shopping_cart // User'),
+        Call(BULK_CART_DELETE, body={'ids': bulk_ids}),
+    ]),
+]
+
+AUTHORING = [
+    (10, [Call('recipes/create_recipes/create_fifth_recipe // User',
+               expect=(201,), body={'name': unique_name},
+               save='own_recipes')]),
+    (8, [Call('recipes/update_recipes/update_recipe // Second User',
+              body={'name': unique_name},
+              firstRecipeId='own_recipe')]),
+    (10, [
+        Call('favorite/add_to_favorite/add_to_favorite // User',
+             expect=(201, 400)),
+        Call('delete_requests/favorite/remove_from_favorite // User',
+             expect=(204, 400)),
+    ]),
+    (2, [Call(BULK_FAVORITE, body={'ids': bulk_ids})]),
+    (8, [
+        Call('subscriptions/create_subscriptions/'
+             'create_subscription // User', expect=(201, 400)),
+        Call('subscriptions/get_subscriptions/'
+             'get_subscription_list_with_recipes_limit_param // User'),
+        Call('delete_requests/subscriptions/'
+             'delete_first_subscription // User', expect=(204, 400)),
+    ]),
+    (2, [Call(BULK_SUBSCRIBE, body={'ids': lambda variables: (
+        variables['random_users'](10)
+    )})]),
+    (5, [Call('users/get_user_info/users_me // User')]),
+    (5, [Call('users/get_user_info/get_user_list_with_limit_param // User')]),
+    (1, [
+        Call('users/reset_password/reset_password // User', expect=(204,)),
+        Call('users/reset_password/roll_back_password // User',
+             expect=(204,)),
+    ]),
+    (1, [
+        Call('register_and_get_tokens // No Auth/logout/logout // User',
+             expect=(204,)),
+        Call('register_and_get_tokens // No Auth/logout/get_token',
+             save='token'),
+    ]),
+]
+
+
+def combine(*weighted_mixes):
+    return [(share * weight / sum(weight for weight, _ in mix), task)
+            for share, mix in weighted_mixes
+            for weight, task in mix]
+
+
+MIXES = {
+    'anonymous': ANONYMOUS,
+    'filtered': FILTERED,
+    'autocomplete': AUTOCOMPLETE,
+    'cart': CART,
+    'authoring': AUTHORING,
+    'realistic': combine((60, ANONYMOUS), (15, FILTERED),
+                         (10, AUTOCOMPLETE), (8, CART), (7, AUTHORING)),
+}
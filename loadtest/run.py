@@ -0,0 +1,292 @@
+"""
+Replays a traffic mix against a running stack and writes a JSON report
+with throughput, latency percentiles and error rates per endpoint.
+
+python loadtest/run.py --base-url http://localhost:8000 --mix realistic \
+    --users 20 --duration 60 --output report.json
+"""
+
+import argparse
+import base64
+import json
+import math
+import random
+import subprocess
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import requests
+
+import collection
+from mixes import MIXES, Call
+
+
+PASSWORD = 'LoadTest$Passw0rd'
+NEW_PASSWORD = 'LoadTest$Changed0'
+
+
+class Skip(Exception):
+    """The task can't run yet, e.g. there is no own recipe to update."""
+
+
+class Catalog:
+    """Ids and names discovered from the API before the run."""
+
+    def __init__(self, session, base_url):
+        def get(path):
+            response = session.get(base_url + path)
+            response.raise_for_status()
+            return response.json()
+
+        self.tags = get('/api/tags/')
+        self.ingredients = get('/api/ingredients/')
+        recipes = get('/api/recipes/?limit=100')
+        self.recipe_pages = max(1, recipes['count'] // 10)
+        self.recipe_ids = [recipe['id'] for recipe in recipes['results']]
+        self.user_ids = list({recipe['author']['id']
+                              for recipe in recipes['results']})
+        if not (self.tags and self.ingredients and self.recipe_ids):
+            raise SystemExit('Database is empty, run load_db and '
+                             'seed_benchmark first')
+
+
+class VirtualUser(threading.Thread):
+    def __init__(self, number, options, templates, catalog, mix, run_id,
+                 stop_event):
+        super().__init__(daemon=True)
+        self.stop_event = stop_event
+        self.options = options
+        self.templates = templates
+        self.catalog = catalog
+        self.mix = mix
+        self.session = requests.Session()
+        self.rng = random.Random(f'{options.seed}:{number}')
+        self.email = f'lt-{run_id}-{number}@example.com'
+        self.username = f'lt-{run_id}-{number}'
+        self.token = None
+        self.own_recipes = []
+        self.samples = []
+        self.recording = False
+
+    def variables(self):
+        rng, catalog = self.rng, self.catalog
+        tags = rng.sample(catalog.tags, min(3, len(catalog.tags)))
+        ingredients = rng.sample(catalog.ingredients, 2)
+        authors = rng.sample(catalog.user_ids, min(3, len(catalog.user_ids)))
+        variables = {
+            'baseUrl': self.options.base_url,
+            'email': self.email,
+            'username': self.username,
+            'password': PASSWORD,
+            'newPassword': NEW_PASSWORD,
+            'userToken': self.token,
+            'secondUserToken': self.token,
+            'page': rng.randint(1, catalog.recipe_pages),
+            'ingredientNameFirstLatter': ingredients[0]['name'][
+                :rng.randint(1, 3)
+            ],
+            'firstIngredientAmount': rng.randint(1, 500),
+            'secondIngredientAmount': rng.randint(1, 500),
+            'firstIndredientId': ingredients[0]['id'],
+            'secondIndredientId': ingredients[1]['id'],
+            'random_recipes': lambda count: rng.sample(
+                catalog.recipe_ids, min(count, len(catalog.recipe_ids))
+            ),
+            'random_users': lambda count: rng.sample(
+                catalog.user_ids, min(count, len(catalog.user_ids))
+            ),
+        }
+        for number, name in enumerate(('first', 'second', 'third')):
+            tag = tags[number % len(tags)]
+            variables[f'{name}TagId'] = tag['id']
+            variables[f'{name}TagSlug'] = tag['slug']
+            variables[f'{name}UserId'] = authors[number % len(authors)]
+        variables['userId'] = variables['firstUserId']
+        for name in ('first', 'second', 'third', 'fourth', 'fifth'):
+            variables[f'{name}RecipeId'] = rng.choice(catalog.recipe_ids)
+        variables['recipeId'] = variables['firstRecipeId']
+        return variables
+
+    def call(self, call, record=True):
+        template = call.request
+        if isinstance(template, str):
+            template = self.templates[template]
+        variables = self.variables()
+        for name, source in call.variables.items():
+            if source == 'own_recipe':
+                if not self.own_recipes:
+                    raise Skip
+                variables[name] = self.rng.choice(self.own_recipes)
+            else:
+                variables[name] = variables[source]
+        url, data = template.render(variables, call.body)
+        if data and 'image' in data and self.options.image:
+            data['image'] = self.options.image
+        headers = {}
+        if template.auth:
+            headers['Authorization'] = f'Token {self.token}'
+        start = time.perf_counter()
+        try:
+            response = self.session.request(template.method, url,
+                                            json=data, headers=headers,
+                                            timeout=self.options.timeout)
+            status = response.status_code
+        except requests.RequestException:
+            response, status = None, 0
+        latency = time.perf_counter() - start
+        if record and self.recording:
+            self.samples.append((template.key, latency, status,
+                                 status in call.expect))
+        if response is not None and status in call.expect and call.save:
+            payload = response.json()
+            if call.save == 'token':
+                self.token = payload['auth_token']
+            else:
+                self.own_recipes.append(payload['id'])
+        return response
+
+    def setup(self):
+        self.call(Call('register_and_get_tokens // No Auth/create_users/'
+                       'create_first_user', expect=(201,)), record=False)
+        self.call(Call('register_and_get_tokens // No Auth/get_tokens/'
+                       'get_token_for_first_user', save='token'),
+                  record=False)
+        if self.token is None:
+            raise SystemExit(f'Could not log in as {self.email}, '
+                             f'check throttling settings')
+
+    def teardown(self):
+        for recipe_id in self.own_recipes:
+            self.session.delete(
+                f'{self.options.base_url}/api/recipes/{recipe_id}/',
+                headers={'Authorization': f'Token {self.token}'},
+            )
+
+    def run(self):
+        weights = [weight for weight, _ in self.mix]
+        tasks = [task for _, task in self.mix]
+        while not self.stop_event.is_set():
+            task = self.rng.choices(tasks, weights)[0]
+            try:
+                for call in task:
+                    self.call(call)
+            except Skip:
+                continue
+            if self.options.think:
+                time.sleep(self.rng.expovariate(1 / self.options.think))
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of sorted values."""
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def summarize(samples, duration):
+    latencies = sorted(latency for _, latency, _, _ in samples)
+    errors = sum(1 for *_, ok in samples if not ok)
+    statuses = {}
+    for _, _, status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'count': len(samples),
+        'rps': round(len(samples) / duration, 2),
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2),
+        'statuses': statuses,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--base-url', default='http://localhost:8000')
+    parser.add_argument('--mix', choices=MIXES, default='realistic')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=60)
+    parser.add_argument('--warmup', type=float, default=5)
+    parser.add_argument('--think', type=float, default=0,
+                        help='mean pause between tasks, seconds')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--image', type=argparse.FileType('rb'),
+                        help='image file to upload instead of the tiny '
+                             'one from the collection')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='loadtest-report.json')
+    options = parser.parse_args()
+    if options.image:
+        options.image = 'data:image/{};base64,{}'.format(
+            options.image.name.rsplit('.', 1)[-1].lower(),
+            base64.b64encode(options.image.read()).decode(),
+        )
+    options.base_url = options.base_url.rstrip('/')
+
+    templates = collection.load()
+    catalog = Catalog(requests.Session(), options.base_url)
+    run_id = uuid.uuid4().hex[:8]
+    stop_event = threading.Event()
+    users = []
+    for number in range(options.users):
+        user = VirtualUser(number, options, templates, catalog,
+                           MIXES[options.mix], run_id, stop_event)
+        user.setup()
+        users.append(user)
+    for user in users:
+        user.start()
+    time.sleep(options.warmup)
+    for user in users:
+        user.recording = True
+    started = time.perf_counter()
+    time.sleep(options.duration)
+    for user in users:
+        user.recording = False
+    duration = time.perf_counter() - started
+    stop_event.set()
+    for user in users:
+        user.join()
+        user.teardown()
+
+    samples = [sample for user in users for sample in user.samples]
+    endpoints = {}
+    for sample in samples:
+        endpoints.setdefault(sample[0], []).append(sample)
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'base_url': options.base_url,
+            'mix': options.mix,
+            'users': options.users,
+            'duration_s': round(duration, 2),
+            'think_s': options.think,
+        },
+        'total': summarize(samples, duration) if samples else {},
+        'endpoints': {key: summarize(endpoint_samples, duration)
+                      for key, endpoint_samples in sorted(endpoints.items())},
+    }
+    with open(options.output, 'w', encoding='utf8') as file:
+        json.dump(report, file, indent=2, ensure_ascii=False)
+    for key, stats in report['endpoints'].items():
+        print(f"{key:<60} {stats['rps']:>8} rps  p50 {stats['p50_ms']:>8}"
+              f"  p95 {stats['p95_ms']:>8}  p99 {stats['p99_ms']:>8}"
+              f"  err {stats['error_rate']:.2%}")
+    print(f'Report written to {options.output}')
+
+
+if __name__ == '__main__':
+    main()